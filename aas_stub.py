@@ -0,0 +1,92 @@
+import argparse
+import os
+import threading
+import time
+
+import uvicorn
+from fastapi import Body, FastAPI, HTTPException
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SIMU_CONFIG_PATH = os.path.join(BASE_DIR, "simu_config.txt")
+KEY_PATH = os.path.join(BASE_DIR, "key.txt")
+EXTRA_ELEMENTS = ["RUL"]  # Écrit par le tableau de bord, absent de simu_config.txt
+
+
+def config_elements(path=SIMU_CONFIG_PATH):
+	# Noms des propriétés AAS (partie droite de simu_config.txt, en-tête ignoré) + RUL
+	lines = open(path, 'r').read().split("\n")[1:]
+	return [line.split(':')[1].strip() for line in lines if ':' in line] + EXTRA_ELEMENTS
+
+
+def default_submodel_id(path=KEY_PATH):
+	return open(path, 'r').read().strip() if os.path.exists(path) else "benchmark"
+
+
+# --- Serveur AAS en mémoire (routes du sous-modèle utilisées par api.AASClient) ---
+def create_app(elements=None):
+	elements = elements or config_elements()
+	submodels = {}  # idSousModèle -> {idShort: valeur (chaîne, comme dans l'AAS)}
+	stub = FastAPI(title="AAS en mémoire", description="Remplaçant local d'un serveur AAS pour les tests et mesures.")
+	
+	def submodel(submodel_id):
+		# Tout identifiant est accepté : un sous-modèle est créé au premier accès (un par batterie possible)
+		if submodel_id not in submodels:
+			submodels[submodel_id] = {name: "0" for name in elements}
+		return submodels[submodel_id]
+	
+	def element(submodel_id, id_short):
+		values = submodel(submodel_id)
+		if id_short not in values:
+			raise HTTPException(status_code=404, detail=f"Élément inconnu : {id_short}")
+		return values
+	
+	@stub.get("/submodels/{submodel_id}/$value")
+	def get_submodel_value(submodel_id: str):
+		return dict(submodel(submodel_id))
+	
+	@stub.patch("/submodels/{submodel_id}/$value", status_code=204)
+	def patch_submodel_value(submodel_id: str, values: dict = Body(...)):
+		current = submodel(submodel_id)
+		unknown = [k for k in values if k not in current]
+		if unknown:
+			raise HTTPException(status_code=400, detail=f"Éléments inconnus : {unknown}")
+		current.update({k: str(v) for k, v in values.items()})
+	
+	@stub.get("/submodels/{submodel_id}/submodel-elements/{id_short}")
+	def get_element(submodel_id: str, id_short: str):
+		value = element(submodel_id, id_short)[id_short]
+		return {"idShort": id_short, "modelType": "Property", "valueType": "xs:string", "value": value}
+	
+	@stub.put("/submodels/{submodel_id}/submodel-elements/{id_short}", status_code=204)
+	def put_element(submodel_id: str, id_short: str, payload: dict = Body(...)):
+		element(submodel_id, id_short)[id_short] = str(payload.get("value"))
+	
+	@stub.patch("/submodels/{submodel_id}/submodel-elements/{id_short}/$value", status_code=204)
+	def patch_element_value(submodel_id: str, id_short: str, value=Body(...)):
+		element(submodel_id, id_short)[id_short] = str(value)
+	
+	stub.state.submodels = submodels
+	return stub
+
+
+def start_in_thread(host="127.0.0.1", port=8091, elements=None, timeout=10.0):
+	# Serveur démarré dans un thread (daemon) ; rend la main une fois le port ouvert
+	server = uvicorn.Server(uvicorn.Config(create_app(elements), host=host, port=port, log_level="error"))
+	threading.Thread(target=server.run, daemon=True).start()
+	deadline = time.monotonic() + timeout
+	while not server.started:
+		if time.monotonic() > deadline:
+			raise RuntimeError(f"Le serveur AAS local n'a pas démarré sur {host}:{port}.")
+		time.sleep(0.01)
+	return server
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serveur AAS en mémoire (éléments de simu_config.txt + RUL).")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8081)
+	args = parser.parse_args()
+	
+	print(f"Sous-modèle par défaut : {default_submodel_id()} | éléments : {config_elements()}")
+	uvicorn.run(create_app(), host=args.host, port=args.port, log_level="error")
@@ -1,8 +1,23 @@
 import requests
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+from requests.adapters import HTTPAdapter
+
+from stage_metrics import aas_call_seconds
+
+# Session partagée : les appels successifs réutilisent la même connexion TCP (keep-alive)
+_session = requests.Session()
+# Enveloppe JSON de chaque élément, lue une seule fois puis réutilisée pour les écritures
+_templates = {}
+_MISSING = object()
 
 
 def read_aas_value(url, return_value=False):
-	r = requests.get(url, timeout=5)
+	with aas_call_seconds.time("read_aas_value"):
+		r = _session.get(url, timeout=5)
 	r.raise_for_status()
 	data = r.json()
 	return (round(data["value"], 2) if isinstance(data["value"], float) else data["value"]) if isinstance(data, dict) and not return_value else data
@@ -10,17 +25,344 @@ def read_aas_value(url, return_value=False):
 
 def put_aas_value(url, value):
 	try:
-		json = read_aas_value(url, return_value=True)
+		if url not in _templates:
+			_templates[url] = read_aas_value(url, return_value=True)
+		json = dict(_templates[url])
 		json["value"] = str(value)
-		r = requests.put(url, json=json, timeout=5)
+		with aas_call_seconds.time("put_aas_value"):
+			r = _session.put(url, json=json, timeout=5)
 		r.raise_for_status()
 		return True
 	
 	except requests.exceptions.RequestException as e:
+		# Le modèle en cache est peut-être périmé (élément modifié côté serveur) : on le relira
+		_templates.pop(url, None)
 		print(f"Erreur lors de la requête : {e}")
 		return None
 
 
+# --- Client AAS mutualisé ---
+def _to_int(value):
+	return int(float(value))
+
+
+def _is_unsupported(error):
+	# Réponses d'un serveur qui n'implémente pas une route optionnelle de l'API AAS
+	return error.response is not None and error.response.status_code in (400, 404, 405, 501)
+
+
+class BatteryTelemetry(TypedDict, total=False):
+	Capacity: float
+	Voltage_measured: float
+	Current_measured: float
+	Temperature_measured: float
+	Time: float
+	id_cycle: int
+	RUL: int
+
+
+# Éléments lus à chaque rafraîchissement du tableau de bord, avec leur type
+TELEMETRY_TYPES = {
+	"Capacity": float,
+	"Voltage_measured": float,
+	"Current_measured": float,
+	"Temperature_measured": float,
+	"Time": float,
+	"id_cycle": _to_int,
+	"RUL": _to_int
+}
+
+
+class AASClient:
+	def __init__(self, api_url, submodel_id, timeout=5, pool_size=16, max_workers=8):
+		self.api_url = api_url.rstrip("/")
+		self.submodel_id = submodel_id
+		self.timeout = timeout
+		
+		# Pool de connexions keep-alive dimensionné pour les lectures concurrentes
+		self.session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+		self.session.mount("http://", adapter)
+		self.session.mount("https://", adapter)
+		self._executor = ThreadPoolExecutor(max_workers=max_workers)
+		
+		# Routes optionnelles de l'API AAS : None = pas encore testée, True/False = supportée ou non
+		self.capabilities = {
+			"read_submodel_value": None,
+			"patch_element_value": None,
+			"patch_submodel_value": None
+		}
+		self._templates = {}
+	
+	@property
+	def submodel_url(self):
+		return f"{self.api_url}/submodels/{self.submodel_id}"
+	
+	def element_url(self, id_short):
+		return f"{self.submodel_url}/submodel-elements/{id_short}"
+	
+	def read_value(self, id_short):
+		with aas_call_seconds.time("read_value"):
+			r = self.session.get(self.element_url(id_short), timeout=self.timeout)
+		r.raise_for_status()
+		return r.json()["value"]
+	
+	def read_values(self, id_shorts):
+		# Lectures élément par élément, lancées en parallèle sur le pool de connexions
+		return dict(zip(id_shorts, self._executor.map(self.read_value, id_shorts)))
+	
+	def read_submodel_values(self):
+		# Un seul aller-retour : sérialisation "ValueOnly" de tout le sous-modèle
+		with aas_call_seconds.time("read_submodel_values"):
+			r = self.session.get(f"{self.submodel_url}/$value", timeout=self.timeout)
+		r.raise_for_status()
+		values = r.json()
+		# Certains serveurs encapsulent les valeurs sous l'idShort du sous-modèle
+		if isinstance(values, dict) and len(values) == 1:
+			inner = next(iter(values.values()))
+			if isinstance(inner, dict):
+				return inner
+		return values
+	
+	def _with_fallback(self, capability, fast, slow):
+		# Essaie la route optimisée ; si le serveur ne la connaît pas, on s'en souvient et on bascule
+		if self.capabilities[capability] is not False:
+			try:
+				result = fast()
+				self.capabilities[capability] = True
+				return result
+			except requests.exceptions.HTTPError as e:
+				if self.capabilities[capability] or not _is_unsupported(e):
+					raise
+				self.capabilities[capability] = False
+		return slow()
+	
+	def read_many(self, id_shorts):
+		id_shorts = list(id_shorts)
+		
+		def bulk():
+			values = self.read_submodel_values()
+			return {k: values[k] for k in id_shorts if k in values} if isinstance(values, dict) else {}
+		
+		values = self._with_fallback("read_submodel_value", bulk, dict)
+		missing = [k for k in id_shorts if k not in values]
+		if missing:
+			if not values:
+				# $value ne contient aucun des éléments demandés : inutile de le redemander aux ticks suivants
+				self.capabilities["read_submodel_value"] = False
+			# Seuls les éléments absents de $value sont relus un par un
+			values.update(self.read_values(missing))
+		return {k: values[k] for k in id_shorts}
+	
+	def read_telemetry(self, id_shorts=tuple(TELEMETRY_TYPES)) -> BatteryTelemetry:
+		values = self.read_many(id_shorts)
+		return {k: TELEMETRY_TYPES[k](v) for k, v in values.items()}
+	
+	def template(self, id_short):
+		# Métadonnées de l'élément (idShort, valueType, ...) lues une fois pour les PUT complets
+		if id_short not in self._templates:
+			with aas_call_seconds.time("read_template"):
+				r = self.session.get(self.element_url(id_short), timeout=self.timeout)
+			r.raise_for_status()
+			self._templates[id_short] = r.json()
+		return self._templates[id_short]
+	
+	def _put_element(self, id_short, value):
+		payload = dict(self.template(id_short))
+		payload["value"] = str(value)
+		try:
+			with aas_call_seconds.time("put_element"):
+				r = self.session.put(self.element_url(id_short), json=payload, timeout=self.timeout)
+			r.raise_for_status()
+		except requests.exceptions.RequestException:
+			self._templates.pop(id_short, None)
+			raise
+		return True
+	
+	def _patch_element_value(self, id_short, value):
+		# Écriture "ValueOnly" : un seul aller-retour, sans relire l'élément
+		with aas_call_seconds.time("patch_element_value"):
+			r = self.session.patch(f"{self.element_url(id_short)}/$value", json=str(value), timeout=self.timeout)
+		r.raise_for_status()
+		return True
+	
+	def write_value(self, id_short, value):
+		return self._with_fallback(
+			"patch_element_value",
+			lambda: self._patch_element_value(id_short, value),
+			lambda: self._put_element(id_short, value)
+		)
+	
+	def _write_concurrently(self, values):
+		def write(item):
+			try:
+				return self.write_value(*item)
+			except requests.exceptions.RequestException as e:
+				print(f"Erreur lors de l'écriture de {item[0]} : {e}")
+				return False
+		return dict(zip(values, self._executor.map(write, values.items())))
+	
+	def _patch_submodel_values(self, values):
+		with aas_call_seconds.time("patch_submodel_values"):
+			r = self.session.patch(f"{self.submodel_url}/$value", json={k: str(v) for k, v in values.items()}, timeout=self.timeout)
+		r.raise_for_status()
+		return {k: True for k in values}
+	
+	def write_values(self, values):
+		# Écrit N éléments : un PATCH du sous-modèle si possible, sinon écritures parallèles
+		if not values:
+			return {}
+		try:
+			return self._with_fallback(
+				"patch_submodel_value",
+				lambda: self._patch_submodel_values(values),
+				lambda: self._write_concurrently(values)
+			)
+		except requests.exceptions.RequestException as e:
+			print(f"Erreur lors de l'écriture groupée : {e}")
+			return self._write_concurrently(values)
+	
+	def close(self):
+		self._executor.shutdown(wait=False)
+		self.session.close()
+
+
+
+# --- File d'écriture asynchrone vers l'AAS ---
+class AASWriteBack:
+	def __init__(self, client, flush_interval=1.0, backoff_base=0.5, backoff_max=30.0, max_retries=None, history=1000):
+		self.client = client
+		self.flush_interval = flush_interval
+		self.backoff_base = backoff_base
+		self.backoff_max = backoff_max
+		self.max_retries = max_retries  # None = réessais sans limite (valeur conservée jusqu'au succès)
+		
+		self._pending = {}  # idShort -> dernière valeur demandée (les précédentes sont fusionnées)
+		self._inflight = {}  # idShort -> valeur en cours d'envoi
+		self._written = {}  # idShort -> dernière valeur confirmée par le serveur
+		self._attempts = {}  # idShort -> échecs consécutifs
+		self._retry_at = 0.0
+		self._condition = threading.Condition()
+		self._stopped = False
+		self._thread = None
+		
+		self.n_submitted = 0
+		self.n_coalesced = 0
+		self.n_unchanged = 0
+		self.n_flushes = 0
+		self.n_written = 0
+		self.n_failed = 0
+		self.n_abandoned = 0
+		self.flush_latencies = deque(maxlen=history)
+	
+	def submit(self, id_short, value):
+		# Jamais bloquant : la valeur est déposée, l'écriture a lieu au prochain envoi groupé
+		with self._condition:
+			self.n_submitted += 1
+			# Valeur la plus récente connue : en attente, sinon en cours d'envoi, sinon confirmée
+			if id_short in self._pending:
+				newest = self._pending[id_short]
+			elif id_short in self._inflight:
+				newest = self._inflight[id_short]
+			else:
+				newest = self._written.get(id_short, _MISSING)
+			if newest == value:
+				self.n_unchanged += 1
+				return False
+			if id_short not in self._inflight and self._written.get(id_short, _MISSING) == value:
+				# Retour à la valeur déjà présente côté serveur : l'écriture en attente devient caduque
+				self._pending.pop(id_short)
+				self.n_unchanged += 1
+				return False
+			if id_short in self._pending:
+				self.n_coalesced += 1
+			self._pending[id_short] = value
+			self._ensure_worker()
+			return True
+	
+	def _ensure_worker(self):
+		if self._thread is None or not self._thread.is_alive():
+			self._stopped = False
+			self._thread = threading.Thread(target=self._run, daemon=True)
+			self._thread.start()
+	
+	def _run(self):
+		while True:
+			with self._condition:
+				delay = max(self.flush_interval, self._retry_at - time.monotonic())
+				self._condition.wait(delay)
+				if self._stopped:
+					return
+			self.flush()
+	
+	def flush(self):
+		with self._condition:
+			if not self._pending or (time.monotonic() < self._retry_at and not self._stopped):
+				return 0
+			batch, self._pending = self._pending, {}
+			self._inflight = batch
+		
+		start = time.perf_counter()
+		try:
+			results = self.client.write_values(batch)
+		except Exception as e:
+			print(f"Erreur lors de l'écriture groupée : {e}")
+			results = {k: False for k in batch}
+		latency = time.perf_counter() - start
+		
+		with self._condition:
+			self._inflight = {}
+			self.n_flushes += 1
+			self.flush_latencies.append(latency)
+			failed = [k for k in batch if not results.get(k)]
+			for k in batch:
+				if results.get(k):
+					self._written[k] = batch[k]
+					self._attempts.pop(k, None)
+					self.n_written += 1
+			
+			for k in failed:
+				self.n_failed += 1
+				self._attempts[k] = self._attempts.get(k, 0) + 1
+				if self.max_retries is not None and self._attempts[k] > self.max_retries:
+					self._attempts.pop(k)
+					self.n_abandoned += 1
+				else:
+					# Une valeur plus récente déposée pendant l'envoi reste prioritaire
+					self._pending.setdefault(k, batch[k])
+			
+			# Attente exponentielle (plafonnée) après un échec, remise à zéro au premier succès complet
+			streak = max(self._attempts.values(), default=0)
+			self._retry_at = time.monotonic() + min(self.backoff_max, self.backoff_base * 2 ** (streak - 1)) if streak else 0.0
+		return len(batch) - len(failed)
+	
+	def close(self, flush=True):
+		with self._condition:
+			self._stopped = True
+			self._condition.notify_all()
+		if self._thread is not None:
+			self._thread.join()
+		if flush:
+			self.flush()
+	
+	def metrics(self):
+		with self._condition:
+			latencies_ms = sorted(1e3 * t for t in self.flush_latencies) or [0.0]
+			return {
+				"queue_depth": len(self._pending),
+				"n_submitted": self.n_submitted,
+				"n_coalesced": self.n_coalesced,
+				"n_unchanged": self.n_unchanged,
+				"n_flushes": self.n_flushes,
+				"n_written": self.n_written,
+				"n_failed": self.n_failed,
+				"n_abandoned": self.n_abandoned,
+				"retry_in_s": round(max(0.0, self._retry_at - time.monotonic()), 3),
+				"flush_ms_p50": round(latencies_ms[len(latencies_ms) // 2], 3),
+				"flush_ms_max": round(latencies_ms[-1], 3)
+			}
+
+
 if __name__ == "__main__":
 	r = requests.get("http://localhost:8081/submodels/aHR0cHM6Ly9leGFtcGxlLmNvbS9pZHMvc20vMjA1NF80MTcxXzExNDJfMDQ3OA/submodel-elements/RUL", timeout=5)
 	r.raise_for_status()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import uvicorn
+
+import aas_stub
+from api import AASClient
+from dataset_cache import load_frame
+from history_store import HistoryStore
+
+# --- Configuration ---
+HOST = "127.0.0.1"
+AAS_PORT = 8091
+API_PORT = 8001
+DATASET_PATH = "discharge.csv"
+REQUEST_FIELDS = ['Capacity', 'Voltage_measured', 'Temperature_measured', 'Current_measured', 'Time', 'id_cycle']
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "per_s"]
+WARMUP = 20
+
+
+# --- Statistiques ---
+def latency_summary(seconds, elapsed=None):
+	# Percentiles en ms ; débit calculé sur le temps mural de la scène (ou la somme des latences)
+	ms = np.asarray(seconds, dtype=np.float64) * 1e3
+	if not len(ms):
+		# Rien de mesuré (ex. --ticks 0) : pas de percentiles
+		return {"n": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "per_s": None}
+	elapsed = elapsed if elapsed is not None else ms.sum() / 1e3
+	return {
+		"n": int(len(ms)),
+		"mean_ms": round(float(ms.mean()), 3),
+		"p50_ms": round(float(np.percentile(ms, 50)), 3),
+		"p95_ms": round(float(np.percentile(ms, 95)), 3),
+		"p99_ms": round(float(np.percentile(ms, 99)), 3),
+		"max_ms": round(float(ms.max()), 3),
+		"per_s": round(len(ms) / elapsed, 2) if elapsed > 0 else 0.0
+	}
+
+
+def sample_requests(csv_path, n, seed):
+	# Mêmes lignes du dataset d'une exécution à l'autre (graine fixe), sans remise tant que le dataset suffit
+	frame = load_frame(REQUEST_FIELDS, csv_path)
+	rows = np.random.default_rng(seed).choice(len(frame), n, replace=n > len(frame))
+	records = frame.iloc[rows].to_dict("records")
+	return [{k: (int(v) if k == "id_cycle" else float(v)) for k, v in record.items()} for record in records]
+
+
+# --- Serveurs locaux ---
+def start_prediction_api(host=HOST, port=API_PORT, timeout=30.0):
+	import prediction_module
+	server = uvicorn.Server(uvicorn.Config(prediction_module.app, host=host, port=port, log_level="error"))
+	threading.Thread(target=server.run, daemon=True).start()
+	deadline = time.monotonic() + timeout
+	while not server.started:
+		if time.monotonic() > deadline:
+			raise RuntimeError(f"L'API de prédiction n'a pas démarré sur {host}:{port}.")
+		time.sleep(0.01)
+	# Chargement du modèle hors mesure
+	requests.get(f"http://{host}:{port}/", timeout=timeout).raise_for_status()
+	return server
+
+
+# --- Scénarios ---
+def bench_predict_latency(api_url, samples, warmup_samples):
+	session = requests.Session()
+	for sample in warmup_samples:
+		session.post(f"{api_url}/predict", json=sample, timeout=10).raise_for_status()
+	
+	latencies = []
+	for sample in samples:
+		start = time.perf_counter()
+		session.post(f"{api_url}/predict", json=sample, timeout=10).raise_for_status()
+		latencies.append(time.perf_counter() - start)
+	return latency_summary(latencies)
+
+
+def bench_predict_throughput(api_url, samples, warmup_samples, concurrency):
+	# Une session (connexion keep-alive) par thread client
+	local = threading.local()
+	
+	def call(sample):
+		if not hasattr(local, "session"):
+			local.session = requests.Session()
+		start = time.perf_counter()
+		local.session.post(f"{api_url}/predict", json=sample, timeout=30).raise_for_status()
+		return time.perf_counter() - start
+	
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		list(pool.map(call, warmup_samples))
+		start = time.perf_counter()
+		latencies = list(pool.map(call, samples))
+		elapsed = time.perf_counter() - start
+	return {"concurrency": concurrency, **latency_summary(latencies, elapsed)}
+
+
+def bench_aas_writes(aas_url, csv_path, n_rows, concurrency):
+	# Boucle de rejeu réelle (simu.ReplayEngine), sans cadencement, sur les n_rows premières lignes
+	import asyncio
+	from simu import ReplayEngine
+	engine = ReplayEngine(api_url=aas_url, speed=0, concurrency=concurrency, max_rows=n_rows, latency_history=n_rows)
+	report = asyncio.run(engine.run(csv_path, loops=1, report_every=0))
+	return {"concurrency": concurrency, "errors": report["errors"],
+			**latency_summary(engine.stats.latencies, report["elapsed_s"])}
+
+
+def bench_dashboard_tick(aas_url, submodel_id, samples, max_cap=2.0):
+	# Chemin de données de main.py, sans Streamlit : lecture AAS, stockage, prédiction, écriture de la RUL
+	from prediction_module import PredictionService
+	client = AASClient(aas_url, submodel_id)
+	service = PredictionService()
+	history = HistoryStore()
+	
+	def tick():
+		telemetry = client.read_telemetry()
+		data = {
+			"capacity": round((100 * telemetry["Capacity"]) / max_cap, 2),
+			"voltage": telemetry["Voltage_measured"],
+			"current": telemetry["Current_measured"],
+			"temperature": telemetry["Temperature_measured"],
+			"cycle_time": telemetry["Time"],
+			"id_cycle": telemetry["id_cycle"]
+		}
+		history.append(data)
+		rul = service.predict({k: telemetry[k] for k in REQUEST_FIELDS})
+		client.write_value("RUL", rul)
+	
+	latencies = []
+	try:
+		for i, sample in enumerate(samples):
+			# Nouvelle mesure écrite par le "simulateur" (hors mesure), puis un tick chronométré
+			client.write_values(sample)
+			if i < WARMUP:
+				tick()
+				continue
+			start = time.perf_counter()
+			tick()
+			latencies.append(time.perf_counter() - start)
+	finally:
+		client.close()
+	return latency_summary(latencies)
+
+
+# --- Exécution et comparaison ---
+def git_commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+							  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+	except OSError:
+		return None
+
+
+def run(csv_path=DATASET_PATH, n_requests=500, concurrency=8, n_rows=1000, n_ticks=200, seed=0,
+		aas_port=AAS_PORT, api_port=API_PORT):
+	aas_url, api_url = f"http://{HOST}:{aas_port}", f"http://{HOST}:{api_port}"
+	aas_stub.start_in_thread(HOST, aas_port)
+	start_prediction_api(HOST, api_port)
+	# Tranches disjointes pour chaque échauffement et chaque mesure : une requête mesurée n'est jamais
+	# un succès du cache de prédiction dû à l'échauffement ou au scénario précédent
+	sizes = [WARMUP, n_requests, WARMUP * concurrency, n_requests, WARMUP + n_ticks]
+	samples = sample_requests(csv_path, sum(sizes), seed)
+	bounds = np.cumsum([0] + sizes)
+	warm_latency, latency, warm_throughput, throughput, ticks = (samples[a:b] for a, b in zip(bounds[:-1], bounds[1:]))
+	
+	import prediction_module
+	results = {
+		"meta": {
+			"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"git_commit": git_commit(),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"cpu_count": os.cpu_count(),
+			"model_version": prediction_module.registry.status()["model_version"],
+			"params": {"csv_path": csv_path, "n_requests": n_requests, "concurrency": concurrency,
+					   "n_rows": n_rows, "n_ticks": n_ticks, "seed": seed}
+		},
+		"scenarios": {}
+	}
+	scenarios = [
+		("predict_latency", lambda: bench_predict_latency(api_url, latency, warm_latency)),
+		("predict_throughput", lambda: bench_predict_throughput(api_url, throughput, warm_throughput, concurrency)),
+		("aas_write_replay", lambda: bench_aas_writes(aas_url, csv_path, n_rows, concurrency)),
+		("dashboard_tick", lambda: bench_dashboard_tick(aas_url, aas_stub.default_submodel_id(),
+														ticks))
+	]
+	for name, scenario in scenarios:
+		print(f"[{name}] ...", flush=True)
+		results["scenarios"][name] = scenario()
+		r = results["scenarios"][name]
+		print(f"[{name}] p50 {r['p50_ms']} ms | p95 {r['p95_ms']} ms | p99 {r['p99_ms']} ms | {r['per_s']} /s")
+	return results
+
+
+def compare(current, baseline):
+	# Écart relatif par métrique (latences : négatif = mieux ; débit : positif = mieux)
+	print(f"\n--- Comparaison avec {baseline['meta'].get('git_commit')} ({baseline['meta'].get('created_at')}) ---")
+	for name, metrics in current["scenarios"].items():
+		previous = baseline["scenarios"].get(name)
+		if previous is None:
+			continue
+		deltas = []
+		for metric in COMPARED_METRICS:
+			before, after = previous.get(metric), metrics.get(metric)
+			if before and after is not None:
+				deltas.append(f"{metric} {before} -> {after} ({100 * (after - before) / before:+.1f} %)")
+		print(f"{name}: " + " | ".join(deltas))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Mesures de bout en bout (AAS en mémoire + API de prédiction).")
+	parser.add_argument("--csv", default=DATASET_PATH)
+	parser.add_argument("--requests", type=int, default=500, help="Requêtes /predict par scénario")
+	parser.add_argument("--concurrency", type=int, default=8)
+	parser.add_argument("--rows", type=int, default=1000, help="Lignes rejouées vers l'AAS")
+	parser.add_argument("--ticks", type=int, default=200, help="Rafraîchissements du tableau de bord mesurés")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--aas-port", type=int, default=AAS_PORT)
+	parser.add_argument("--api-port", type=int, default=API_PORT)
+	parser.add_argument("--output", default=None, help="Fichier JSON des résultats")
+	parser.add_argument("--compare", default=None, help="Résultats JSON d'une exécution précédente")
+	args = parser.parse_args()
+	
+	results = run(args.csv, args.requests, args.concurrency, args.rows, args.ticks, args.seed, args.aas_port, args.api_port)
+	output = json.dumps(results, indent=1)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(output)
+	else:
+		print(output)
+	if args.compare:
+		with open(args.compare, "r") as f:
+			compare(results, json.load(f))
+	sys.exit(0)
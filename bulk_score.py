@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from dataset_cache import ensure_cache, load_cached_columns, read_manifest
+
+# --- Configuration ---
+MODEL_PATH = "rul_model.pkl"
+FEATURES_PATH = "features_list.pkl"
+OUTPUT_DIR = "scores"
+CHUNK_ROWS = 100_000
+KEY_COLUMNS = ["Battery", "id_cycle", "Time"]  # Recopiées dans la sortie ligne à ligne si présentes
+
+_worker = {}
+
+
+# --- Côté worker : modèle chargé une fois par processus ---
+def _init_worker(model_path, features_path):
+	warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+	_worker["model"] = joblib.load(model_path, mmap_mode="r")
+	_worker["features"] = joblib.load(features_path)
+
+
+def _score_chunk(cache_dir, key_columns, battery_label, start, stop, part_path):
+	# Les colonnes sont projetées depuis le cache : seuls (start, stop) transitent entre processus
+	features = _worker["features"]
+	arrays = load_cached_columns(features + key_columns, cache_dir)
+	X = np.column_stack([np.asarray(arrays[f][start:stop], dtype=np.float64) for f in features])
+	rul = np.maximum(0, np.rint(_worker["model"].predict(X))).astype(np.int64)
+	
+	part = pd.DataFrame({"row": np.arange(start, stop)})
+	for column in key_columns:
+		part[column] = np.asarray(arrays[column][start:stop])
+	if "Battery" not in key_columns:
+		part["Battery"] = battery_label
+	part["RUL_predicted"] = rul
+	
+	# Écriture atomique : un fichier de partie présent est forcément complet (reprise sûre)
+	part.to_csv(part_path + ".tmp", index=False)
+	os.replace(part_path + ".tmp", part_path)
+	return stop - start
+
+
+# --- Préparation d'un travail (un fichier d'entrée) ---
+def resolve_source(path):
+	# CSV (converti une fois en cache colonnaire) ou répertoire de cache colonnaire existant
+	if os.path.isdir(path):
+		return path, read_manifest(path)
+	cache_dir = ensure_cache(path)
+	return cache_dir, read_manifest(cache_dir)
+
+
+def job_description(path, manifest, model_path, features, chunk_rows):
+	model_stat = os.stat(model_path)
+	return {
+		"source": os.path.abspath(path),
+		"source_sha256": manifest["source"]["sha256"] if "source" in manifest else None,
+		"n_rows": manifest["n_rows"],
+		"model": {"path": os.path.abspath(model_path), "size": model_stat.st_size, "mtime_ns": model_stat.st_mtime_ns},
+		"features": list(features),
+		"chunk_rows": chunk_rows
+	}
+
+
+def job_dir_for(path, output_dir=OUTPUT_DIR):
+	# Nom lisible + empreinte du chemin absolu : deux "discharge.csv" de dossiers différents ne partagent pas de sortie
+	name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+	digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+	return os.path.join(output_dir, f"{name}-{digest}")
+
+
+def prepare_job(path, job_dir, description, restart=False):
+	# Reprise uniquement si source, modèle et découpage sont identiques ; sinon --restart requis
+	job_path = os.path.join(job_dir, "job.json")
+	if os.path.exists(job_path) and not restart:
+		with open(job_path, "r") as f:
+			previous = json.load(f)
+		if previous != description:
+			raise RuntimeError(f"'{job_dir}' contient un travail différent (source, modèle ou découpage) : "
+							   f"utiliser --restart pour recommencer.")
+	else:
+		shutil.rmtree(job_dir, ignore_errors=True)
+		os.makedirs(os.path.join(job_dir, "parts"))
+		with open(job_path + ".tmp", "w") as f:
+			json.dump(description, f, indent=1)
+		os.replace(job_path + ".tmp", job_path)
+
+
+def part_path(job_dir, index):
+	return os.path.join(job_dir, "parts", f"part_{index:06d}.csv")
+
+
+# --- Agrégation finale ---
+def finalize(job_dir, n_parts):
+	# rows.csv (concaténation ordonnée), puis agrégats par (batterie, cycle) et par batterie
+	partials = []
+	rows_path = os.path.join(job_dir, "rows.csv")
+	with open(rows_path + ".tmp", "w", newline="") as out:
+		for index in range(n_parts):
+			part = pd.read_csv(part_path(job_dir, index))
+			part.to_csv(out, index=False, header=index == 0)
+			if "id_cycle" in part:
+				grouped = part.groupby(["Battery", "id_cycle"], sort=False)["RUL_predicted"]
+				partials.append(pd.DataFrame({
+					"n_rows": grouped.size(), "rul_sum": grouped.sum(), "rul_min": grouped.min(),
+					"rul_max": grouped.max(), "rul_last": grouped.last(), "part": index
+				}).reset_index())
+	os.replace(rows_path + ".tmp", rows_path)
+	if not partials:
+		return None
+	
+	# Un cycle peut chevaucher deux parties : fusion des agrégats partiels
+	partials = pd.concat(partials).sort_values("part")
+	grouped = partials.groupby(["Battery", "id_cycle"])
+	cycles = pd.DataFrame({
+		"n_rows": grouped["n_rows"].sum(),
+		"rul_mean": grouped["rul_sum"].sum() / grouped["n_rows"].sum(),
+		"rul_min": grouped["rul_min"].min(),
+		"rul_max": grouped["rul_max"].max(),
+		"rul_last": grouped["rul_last"].last()
+	}).reset_index()
+	cycles.to_csv(os.path.join(job_dir, "cycles.csv"), index=False)
+	
+	by_battery = cycles.sort_values("id_cycle").groupby("Battery")
+	batteries = pd.DataFrame({
+		"n_cycles": by_battery.size(),
+		"last_cycle": by_battery["id_cycle"].last(),
+		"rul_last": by_battery["rul_last"].last(),
+		"rul_min": by_battery["rul_min"].min()
+	}).reset_index()
+	batteries.to_csv(os.path.join(job_dir, "batteries.csv"), index=False)
+	return batteries
+
+
+# --- Exécution ---
+def score_files(paths, output_dir=OUTPUT_DIR, model_path=MODEL_PATH, features_path=FEATURES_PATH,
+				chunk_rows=CHUNK_ROWS, workers=None, restart=False):
+	features = joblib.load(features_path)
+	workers = workers or os.cpu_count()
+	summary = {}
+	
+	with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+							 initargs=(model_path, features_path)) as pool:
+		for path in paths:
+			cache_dir, manifest = resolve_source(path)
+			name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+			job_dir = job_dir_for(path, output_dir)
+			prepare_job(path, job_dir, job_description(path, manifest, model_path, features, chunk_rows), restart)
+			
+			n_rows = manifest["n_rows"]
+			key_columns = [c for c in KEY_COLUMNS if c in manifest["columns"]]
+			bounds = [(s, min(s + chunk_rows, n_rows)) for s in range(0, n_rows, chunk_rows)]
+			todo = [i for i in range(len(bounds)) if not os.path.exists(part_path(job_dir, i))]
+			print(f"--- {path} : {n_rows} lignes, {len(bounds)} partie(s), {len(bounds) - len(todo)} déjà calculée(s) ---")
+			
+			start, done = time.perf_counter(), 0
+			futures = [pool.submit(_score_chunk, cache_dir, key_columns, name, *bounds[i], part_path(job_dir, i))
+					   for i in todo]
+			for future in as_completed(futures):
+				done += future.result()
+				elapsed = time.perf_counter() - start
+				print(f"\r{done}/{sum(b - a for a, b in (bounds[i] for i in todo))} lignes | "
+					  f"{done / elapsed:,.0f} lignes/s", end="", flush=True)
+			elapsed = time.perf_counter() - start
+			print()
+			
+			batteries = finalize(job_dir, len(bounds))
+			summary[path] = {"rows_scored": done, "seconds": round(elapsed, 3),
+							 "rows_per_s": round(done / elapsed, 1) if elapsed > 0 and done else None,
+							 "output": job_dir}
+			if batteries is not None:
+				print(batteries.to_string(index=False))
+	return summary
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Calcul hors ligne de la RUL sur des historiques de décharge.")
+	parser.add_argument("inputs", nargs="+", help="Fichiers CSV ou répertoires de cache colonnaire")
+	parser.add_argument("--output-dir", default=OUTPUT_DIR)
+	parser.add_argument("--model", default=MODEL_PATH)
+	parser.add_argument("--features", default=FEATURES_PATH)
+	parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+	parser.add_argument("--workers", type=int, default=None, help="Processus de calcul (défaut : tous les coeurs)")
+	parser.add_argument("--restart", action="store_true", help="Ignore les résultats partiels existants")
+	args = parser.parse_args()
+	
+	try:
+		results = score_files(args.inputs, args.output_dir, args.model, args.features, args.chunk_rows,
+							  args.workers, args.restart)
+	except (RuntimeError, KeyError, ValueError) as e:
+		print(f"Erreur : {e}")
+		sys.exit(1)
+	print(json.dumps(results, indent=1))
@@ -0,0 +1,131 @@
+import math
+import os
+
+import pandas as pd
+
+# --- Configuration ---
+VOLTAGE_KNEE = 3.5  # Tension (V) sous laquelle on considère le coude de décharge atteint
+CYCLE_FEATURES = [
+	'Capacity', 'Duration', 'Time_to_knee',
+	'Voltage_mean', 'Voltage_std', 'Voltage_min',
+	'Current_mean', 'Current_std',
+	'Temperature_mean', 'Temperature_std', 'Temperature_max'
+]
+# Modèle entraîné sur les agrégats par cycle (model.py --per-cycle), à côté du code quel que soit le répertoire courant
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CYCLE_MODEL_PATH = os.environ.get("RUL_CYCLE_MODEL_PATH", os.path.join(BASE_DIR, "rul_cycle_model.pkl"))
+CYCLE_FEATURES_PATH = os.environ.get("RUL_CYCLE_FEATURES_PATH", os.path.join(BASE_DIR, "cycle_features_list.pkl"))
+# Colonne brute -> préfixe des agrégats
+STAT_COLUMNS = {'Voltage_measured': 'Voltage', 'Current_measured': 'Current', 'Temperature_measured': 'Temperature'}
+
+
+# --- Statistiques glissantes en mémoire constante ---
+class RunningStats:
+	def __init__(self):
+		self.n = 0
+		self.mean = 0.0
+		self.m2 = 0.0
+		self.min = math.inf
+		self.max = -math.inf
+	
+	def update(self, x):
+		# Algorithme de Welford : moyenne et variance sans conserver les échantillons
+		self.n += 1
+		delta = x - self.mean
+		self.mean += delta / self.n
+		self.m2 += delta * (x - self.mean)
+		self.min = min(self.min, x)
+		self.max = max(self.max, x)
+	
+	@property
+	def std(self):
+		# Écart-type de population (ddof=0), identique à l'agrégation d'entraînement
+		return math.sqrt(self.m2 / self.n) if self.n else 0.0
+
+
+class CycleAccumulator:
+	def __init__(self, id_cycle):
+		self.id_cycle = id_cycle
+		self.stats = {prefix: RunningStats() for prefix in STAT_COLUMNS.values()}
+		self.capacity = None
+		self.first_time = None
+		self.last_time = None
+		self.knee_time = None
+	
+	@property
+	def n_samples(self):
+		return self.stats['Voltage'].n
+	
+	def update(self, sample):
+		time_value = float(sample['Time'])
+		# Le tableau de bord peut relire plusieurs fois le même instantané : doublons ignorés
+		if time_value == self.last_time:
+			return
+		if self.first_time is None:
+			self.first_time = time_value
+		self.last_time = time_value
+		self.capacity = float(sample['Capacity'])
+		
+		for column, prefix in STAT_COLUMNS.items():
+			self.stats[prefix].update(float(sample[column]))
+		if self.knee_time is None and float(sample['Voltage_measured']) < VOLTAGE_KNEE:
+			self.knee_time = time_value
+	
+	def features(self):
+		duration = self.last_time - self.first_time
+		voltage, current, temperature = self.stats['Voltage'], self.stats['Current'], self.stats['Temperature']
+		return {
+			'Capacity': self.capacity,
+			'Duration': duration,
+			# Coude jamais atteint : on retient la durée complète du cycle
+			'Time_to_knee': self.knee_time - self.first_time if self.knee_time is not None else duration,
+			'Voltage_mean': voltage.mean, 'Voltage_std': voltage.std, 'Voltage_min': voltage.min,
+			'Current_mean': current.mean, 'Current_std': current.std,
+			'Temperature_mean': temperature.mean, 'Temperature_std': temperature.std, 'Temperature_max': temperature.max
+		}
+
+
+class CycleAggregator:
+	def __init__(self, min_samples=2):
+		self.min_samples = min_samples
+		self.current = None
+	
+	def update(self, sample):
+		# Renvoie (id_cycle, agrégats) quand un cycle vient de se terminer, sinon None
+		completed = None
+		id_cycle = int(sample['id_cycle'])
+		if self.current is None or id_cycle != self.current.id_cycle:
+			completed = self.flush()
+			self.current = CycleAccumulator(id_cycle)
+		self.current.update(sample)
+		return completed
+	
+	def flush(self):
+		current, self.current = self.current, None
+		if current is None or current.n_samples < self.min_samples:
+			return None
+		return current.id_cycle, current.features()
+
+
+# --- Agrégation vectorisée (entraînement) ---
+def aggregate_cycles(frame, group_columns=('Battery', 'id_cycle')):
+	# Mêmes agrégats que CycleAccumulator, calculés par groupby sur tout le dataset
+	group_columns = list(group_columns)
+	frame = frame.drop_duplicates(group_columns + ['Time'])
+	grouped = frame.groupby(group_columns, observed=True, sort=True)
+	
+	first_time = grouped['Time'].min()
+	out = pd.DataFrame({
+		'Capacity': grouped['Capacity'].last(),
+		'Duration': grouped['Time'].max() - first_time,
+		'n_samples': grouped['Time'].size()
+	})
+	knee_time = frame[frame['Voltage_measured'] < VOLTAGE_KNEE].groupby(group_columns, observed=True)['Time'].min()
+	out['Time_to_knee'] = (knee_time.reindex(out.index) - first_time).fillna(out['Duration'])
+	
+	for column, prefix in STAT_COLUMNS.items():
+		out[f'{prefix}_mean'] = grouped[column].mean()
+		out[f'{prefix}_std'] = grouped[column].std(ddof=0)
+	out['Voltage_min'] = grouped['Voltage_measured'].min()
+	out['Temperature_max'] = grouped['Temperature_measured'].max()
+	return out.reset_index()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+DATASET_PATH = "discharge.csv"
+CACHE_FORMAT = 2  # 2 : types inférés sur tout le fichier (les caches antérieurs sont reconstruits)
+INGEST_CHUNK_ROWS = 100_000
+MANIFEST_NAME = "manifest.json"
+
+
+# --- Identification de la source ---
+def file_sha256(path, block_size=1 << 20):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(block_size), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+def default_cache_dir(csv_path):
+	return os.path.splitext(csv_path)[0] + "_cache"
+
+
+def _read_manifest(cache_dir):
+	try:
+		with open(os.path.join(cache_dir, MANIFEST_NAME), "r") as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+
+def _write_manifest(cache_dir, manifest):
+	tmp_path = os.path.join(cache_dir, MANIFEST_NAME + ".tmp")
+	with open(tmp_path, "w") as f:
+		json.dump(manifest, f, indent=1)
+	os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_NAME))
+
+
+def is_cache_valid(csv_path, cache_dir):
+	# Contrôle rapide sur (taille, mtime) ; en cas de doute, le hash du fichier tranche
+	manifest = _read_manifest(cache_dir)
+	if manifest is None or manifest.get("format") != CACHE_FORMAT:
+		return False
+	
+	stat = os.stat(csv_path)
+	source = manifest["source"]
+	if source["size"] != stat.st_size:
+		return False
+	if source["mtime_ns"] == stat.st_mtime_ns:
+		return True
+	
+	if source["sha256"] != file_sha256(csv_path):
+		return False
+	# Contenu identique (fichier simplement "touché") : on met à jour la date et on garde le cache
+	source["mtime_ns"] = stat.st_mtime_ns
+	_write_manifest(cache_dir, manifest)
+	return True
+
+
+# --- Conversion CSV -> colonnes .npy ---
+def _chunk_kind(series):
+	if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+		return "int64"
+	if pd.api.types.is_numeric_dtype(series):
+		return "float64"
+	return "category"
+
+
+def infer_column_kinds(csv_path, chunk_rows=INGEST_CHUNK_ROWS):
+	# Premier passage : type le plus large vu sur l'ensemble des blocs (int64 < float64 < category).
+	# Un entier suivi plus loin de décimales ou de valeurs manquantes devient float64, de texte une catégorie.
+	order = ["int64", "float64", "category"]
+	kinds = {}
+	for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+		for name, series in chunk.items():
+			kind = _chunk_kind(series)
+			if name not in kinds or order.index(kind) > order.index(kinds[name]):
+				kinds[name] = kind
+	return kinds
+
+
+def ingest(csv_path=DATASET_PATH, cache_dir=None, chunk_rows=INGEST_CHUNK_ROWS):
+	# Lecture du CSV par blocs : colonnes numériques en binaire brut, texte encodé en catégories
+	cache_dir = cache_dir or default_cache_dir(csv_path)
+	tmp_dir = cache_dir + ".tmp"
+	shutil.rmtree(tmp_dir, ignore_errors=True)
+	os.makedirs(tmp_dir)
+	
+	stat = os.stat(csv_path)
+	kinds = infer_column_kinds(csv_path, chunk_rows)
+	columns, raw_files, n_rows = {}, {}, 0
+	text_columns = {name: str for name, kind in kinds.items() if kind == "category"}
+	try:
+		# Second passage : texte relu tel quel (dtype=str), numériques au type large déjà déterminé
+		for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, dtype=text_columns):
+			for name, series in chunk.items():
+				if name not in columns:
+					if kinds[name] == "category":
+						columns[name] = {"kind": "category", "dtype": "int32", "categories": []}
+					else:
+						columns[name] = {"kind": "numeric", "dtype": kinds[name]}
+					raw_files[name] = open(os.path.join(tmp_dir, f"{name}.bin"), "wb")
+				
+				spec = columns[name]
+				if spec["kind"] == "numeric":
+					# Le fichier a pu changer entre les deux passages : jamais de conversion avec perte
+					if spec["dtype"] == "int64" and _chunk_kind(series) != "int64":
+						raise ValueError(f"Colonne '{name}' modifiée pendant la conversion de '{csv_path}'.")
+					values = series.to_numpy(dtype=spec["dtype"])
+				else:
+					categories = spec["categories"]
+					lookup = {c: i for i, c in enumerate(categories)}
+					for label in series.astype(str).unique():
+						if label not in lookup:
+							lookup[label] = len(categories)
+							categories.append(label)
+					values = series.astype(str).map(lookup).to_numpy(dtype=np.int32)
+				raw_files[name].write(np.ascontiguousarray(values).tobytes())
+			n_rows += len(chunk)
+	finally:
+		for f in raw_files.values():
+			f.close()
+	
+	# Binaire brut -> .npy (en-tête + données) pour un chargement en mmap
+	for name, spec in columns.items():
+		raw_path = os.path.join(tmp_dir, f"{name}.bin")
+		raw = np.memmap(raw_path, dtype=spec["dtype"], mode="r", shape=(n_rows,)) if n_rows else np.empty(0, dtype=spec["dtype"])
+		out = np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode="w+", dtype=spec["dtype"], shape=(n_rows,))
+		for start in range(0, n_rows, chunk_rows):
+			out[start:start + chunk_rows] = raw[start:start + chunk_rows]
+		out.flush()
+		del raw, out
+		os.remove(raw_path)
+	
+	_write_manifest(tmp_dir, {
+		"format": CACHE_FORMAT,
+		"source": {"path": os.path.abspath(csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(csv_path)},
+		"n_rows": n_rows,
+		"columns": columns
+	})
+	shutil.rmtree(cache_dir, ignore_errors=True)
+	os.replace(tmp_dir, cache_dir)
+	return cache_dir
+
+
+def ensure_cache(csv_path=DATASET_PATH, cache_dir=None):
+	cache_dir = cache_dir or default_cache_dir(csv_path)
+	if not is_cache_valid(csv_path, cache_dir):
+		print(f"Conversion de '{csv_path}' en cache colonnaire ({cache_dir})...")
+		ingest(csv_path, cache_dir)
+	return cache_dir
+
+
+# --- Chargement sélectif ---
+def load_columns(columns, csv_path=DATASET_PATH, cache_dir=None, mmap_mode="r"):
+	# Tableaux NumPy projetés en mémoire : aucune copie, seules les pages lues sont chargées
+	return load_cached_columns(columns, ensure_cache(csv_path, cache_dir), mmap_mode)
+
+
+def read_manifest(cache_dir):
+	manifest = _read_manifest(cache_dir)
+	if manifest is None or manifest.get("format") != CACHE_FORMAT:
+		raise ValueError(f"'{cache_dir}' n'est pas un cache colonnaire valide.")
+	return manifest
+
+
+def load_cached_columns(columns, cache_dir, mmap_mode="r"):
+	# Lecture directe d'un cache déjà constitué (sans contrôle du CSV d'origine)
+	manifest = read_manifest(cache_dir)
+	missing = [c for c in columns if c not in manifest["columns"]]
+	if missing:
+		raise KeyError(f"Colonnes absentes de '{cache_dir}' : {missing}")
+	
+	arrays = {}
+	for name in columns:
+		spec = manifest["columns"][name]
+		values = np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+		if spec["kind"] == "category":
+			values = pd.Categorical.from_codes(values, categories=spec["categories"])
+		arrays[name] = values
+	return arrays
+
+
+def load_frame(columns, csv_path=DATASET_PATH, cache_dir=None):
+	# DataFrame adossé aux tableaux projetés (copy=False : pas de consolidation des blocs)
+	return pd.DataFrame(load_columns(columns, csv_path, cache_dir), copy=False)
+
+
+if __name__ == "__main__":
+	path = sys.argv[1] if len(sys.argv) > 1 else DATASET_PATH
+	print(f"Cache prêt : {ensure_cache(path)}")
@@ -0,0 +1,29 @@
+import numpy as np
+
+# --- Configuration ---
+POINT_BUDGET = 500  # Points par courbe, de l'ordre de la largeur en pixels d'un sous-graphique
+
+
+def lttb(x, y, n_out):
+	# Largest-Triangle-Three-Buckets : garde la forme de la courbe (pics compris) avec n_out points
+	x = np.asarray(x, dtype=np.float64)
+	y = np.asarray(y, dtype=np.float64)
+	n = len(x)
+	if n_out >= n or n_out < 3:
+		return x, y
+	
+	# Premier et dernier points conservés, n_out - 2 seaux répartis sur les points intérieurs
+	edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+	keep = np.empty(n_out, dtype=np.int64)
+	keep[0], keep[-1] = 0, n - 1
+	a = 0
+	for i in range(n_out - 2):
+		start, stop = edges[i], edges[i + 1]
+		# Sommet C : moyenne du seau suivant (dernier point pour le dernier seau)
+		next_stop = edges[i + 2] if i + 2 < len(edges) else n
+		cx, cy = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+		# Aire du triangle (A, B, C) pour chaque candidat B du seau, calculée d'un bloc
+		areas = np.abs((x[a] - cx) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (cy - y[a]))
+		a = start + int(np.argmax(areas))
+		keep[i + 1] = a
+	return x[keep], y[keep]
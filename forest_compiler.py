@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+# --- Configuration ---
+CHUNK_ROWS = 1024  # Taille des blocs de lignes pour borner la mémoire de parcours
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+
+
+# --- Forêt compilée en tableaux plats ---
+class CompiledForest:
+	def __init__(self, feature, threshold, left, right, value, roots, max_depth):
+		# Tous les arbres sont concaténés : les indices left/right sont globaux,
+		# une feuille pointe sur elle-même pour que le parcours reste vectorisé.
+		# Les noeuds sont rangés en largeur d'abord avec right = left + 1.
+		self.feature = feature
+		self.threshold = threshold
+		self.left = left
+		self.right = right
+		self.value = value
+		self.roots = roots
+		self.max_depth = int(max_depth)
+	
+	@property
+	def n_trees(self):
+		return len(self.roots)
+	
+	@property
+	def n_nodes(self):
+		return len(self.feature)
+	
+	def apply(self, X):
+		# Index (global) de la feuille atteinte par chaque ligne dans chaque arbre : (n_lignes, n_arbres)
+		X = np.ascontiguousarray(X, dtype=np.float32)  # Même précision que sklearn pour les comparaisons
+		X_flat = X.ravel()
+		row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+		nodes = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+		for _ in range(self.max_depth):
+			# Les deux fils sont adjacents (right = left + 1) : pas de np.where ni de lecture de right
+			go_right = X_flat[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+			nodes = self.left[nodes] + go_right
+		return nodes
+	
+	def predict_trees(self, X):
+		# Sortie de chaque arbre pour chaque ligne : (n_lignes, n_arbres)
+		X = np.asarray(X)
+		out = np.empty((X.shape[0], self.n_trees), dtype=np.float64)
+		for start in range(0, X.shape[0], CHUNK_ROWS):
+			out[start:start + CHUNK_ROWS] = self.value[self.apply(X[start:start + CHUNK_ROWS])]
+		return out
+	
+	def predict(self, X):
+		return self.predict_trees(X).mean(axis=1)
+	
+	def predict_with_spread(self, X, quantiles=(0.05, 0.95)):
+		# Un seul parcours : moyenne (= predict), écart-type et quantiles des sorties des arbres
+		per_tree = self.predict_trees(X)
+		return per_tree.mean(axis=1), per_tree.std(axis=1), np.quantile(per_tree, quantiles, axis=1).T
+	
+	def save(self, path):
+		# Un fichier .npy par tableau : rechargeable en mmap_mode
+		os.makedirs(path, exist_ok=True)
+		for name in ARRAY_NAMES:
+			np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+		np.save(os.path.join(path, "max_depth.npy"), np.array(self.max_depth))
+	
+	@classmethod
+	def load(cls, path, mmap_mode=None):
+		arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAY_NAMES}
+		max_depth = int(np.load(os.path.join(path, "max_depth.npy")))
+		return cls(max_depth=max_depth, **arrays)
+
+
+def _breadth_first_order(tree):
+	# Renumérote les noeuds en largeur d'abord en plaçant les deux fils côte à côte
+	order = [0]
+	for node in order:
+		if tree.children_left[node] != -1:
+			order.extend((tree.children_left[node], tree.children_right[node]))
+	return np.asarray(order, dtype=np.intp)
+
+
+def compile_forest(model):
+	# Aplatit les arbres d'un RandomForestRegressor (ou d'un arbre seul) entraîné
+	estimators = getattr(model, "estimators_", [model])
+	features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+	offset, max_depth = 0, 0
+	
+	for estimator in estimators:
+		tree = estimator.tree_
+		order = _breadth_first_order(tree)
+		new_id = np.empty_like(order)
+		new_id[order] = np.arange(len(order))
+		
+		is_leaf = tree.children_left[order] == -1
+		left = np.where(is_leaf, np.arange(len(order)), new_id[tree.children_left[order]])
+		right = np.where(is_leaf, np.arange(len(order)), new_id[tree.children_right[order]])
+		
+		# Une feuille a un seuil infini : le parcours y reste (left = right = elle-même)
+		features.append(np.where(is_leaf, 0, tree.feature[order]))
+		thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+		lefts.append(left + offset)
+		rights.append(right + offset)
+		values.append(tree.value[order, 0, 0])
+		roots.append(offset)
+		
+		offset += tree.node_count
+		max_depth = max(max_depth, tree.max_depth)
+	
+	return CompiledForest(
+		feature=np.concatenate(features).astype(np.intp),
+		threshold=np.concatenate(thresholds).astype(np.float64),
+		left=np.concatenate(lefts).astype(np.intp),
+		right=np.concatenate(rights).astype(np.intp),
+		value=np.concatenate(values).astype(np.float64),
+		roots=np.asarray(roots, dtype=np.intp),
+		max_depth=max_depth
+	)
+
+
+# --- Vérification de parité et micro-benchmark ---
+def check_parity(model, compiled, X):
+	expected = model.predict(X)
+	obtained = compiled.predict(X)
+	max_abs_diff = float(np.max(np.abs(expected - obtained))) if len(X) else 0.0
+	same_rul = bool(np.array_equal(np.maximum(0, np.rint(expected)), np.maximum(0, np.rint(obtained))))
+	return max_abs_diff, same_rul
+
+
+def _median_latency(fn, X, repeats):
+	timings = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		fn(X)
+		timings.append(time.perf_counter() - start)
+	return float(np.median(timings))
+
+
+def _sample_inputs(compiled, n_features, n_rows, csv_path, features):
+	# Données réelles si le CSV est présent, sinon tirage dans la plage des seuils du modèle
+	rng = np.random.default_rng(42)
+	if os.path.exists(csv_path):
+		import pandas as pd
+		data = pd.read_csv(csv_path, usecols=features)[features].to_numpy(dtype=np.float64)
+		return data[rng.integers(0, len(data), n_rows)]
+	
+	X = np.empty((n_rows, n_features))
+	for j in range(n_features):
+		t = compiled.threshold[(compiled.feature == j) & np.isfinite(compiled.threshold)]
+		low, high = (t.min(), t.max()) if len(t) else (0.0, 1.0)
+		X[:, j] = rng.uniform(low, high, n_rows)
+	return X
+
+
+def benchmark(model_path="rul_model.pkl", features_path="features_list.pkl", csv_path="discharge.csv"):
+	import warnings
+	warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+	
+	model = joblib.load(model_path)
+	features = joblib.load(features_path)
+	
+	start = time.perf_counter()
+	compiled = compile_forest(model)
+	print(f"--- Compilation ---")
+	print(f"{compiled.n_trees} arbres, {compiled.n_nodes} noeuds, profondeur max {compiled.max_depth} "
+		  f"({(time.perf_counter() - start) * 1e3:.1f} ms)")
+	
+	X = _sample_inputs(compiled, len(features), 10_000, csv_path, features)
+	max_abs_diff, same_rul = check_parity(model, compiled, X)
+	print(f"\n--- Parité avec model.predict ---")
+	print(f"Écart absolu max : {max_abs_diff:.3e} | RUL arrondies identiques : {same_rul}")
+	
+	print(f"\n--- Latence (médiane) ---")
+	for n_rows, repeats in ((1, 200), (10_000, 5)):
+		sk = _median_latency(model.predict, X[:n_rows], repeats)
+		fast = _median_latency(compiled.predict, X[:n_rows], repeats)
+		print(f"{n_rows:>6} ligne(s) : sklearn {sk * 1e3:8.3f} ms | compilé {fast * 1e3:8.3f} ms | x{sk / fast:.1f}")
+	
+	return same_rul
+
+
+if __name__ == "__main__":
+	sys.exit(0 if benchmark(*sys.argv[1:]) else 1)
@@ -0,0 +1,153 @@
+import os
+
+import numpy as np
+
+# --- Configuration ---
+HISTORY_COLUMNS = ["capacity", "voltage", "current", "temperature", "cycle_time"]
+LIVE_WINDOW = 100  # Points conservés pour la fenêtre temps réel
+INITIAL_CYCLE_ROWS = 256
+
+
+# --- Fenêtre temps réel : tampon circulaire de taille fixe ---
+class RingBuffer:
+	def __init__(self, capacity=LIVE_WINDOW, columns=HISTORY_COLUMNS):
+		self.columns = list(columns)
+		self._col = {name: i for i, name in enumerate(self.columns)}
+		self.data = np.zeros((capacity, len(self.columns)), dtype=np.float64)
+		self.capacity = capacity
+		self.head = 0  # Prochaine case écrite
+		self.size = 0
+	
+	def __len__(self):
+		return self.size
+	
+	def append(self, row):
+		# O(1) : on écrase la plus ancienne valeur au lieu de décaler toute la liste
+		self.data[self.head] = row
+		self.head = (self.head + 1) % self.capacity
+		self.size = min(self.size + 1, self.capacity)
+	
+	def clear(self):
+		self.head = 0
+		self.size = 0
+	
+	def column(self, name):
+		# Valeurs dans l'ordre chronologique (copie de taille <= capacity)
+		values = self.data[:, self._col[name]]
+		if self.size < self.capacity:
+			return values[:self.size].copy()
+		return np.concatenate((values[self.head:], values[:self.head]))
+	
+	def last(self):
+		if not self.size:
+			return None
+		return dict(zip(self.columns, self.data[(self.head - 1) % self.capacity].tolist()))
+
+
+# --- Archive des cycles : colonnes en ajout seul + résumés incrémentaux ---
+class CycleArchive:
+	def __init__(self, columns=HISTORY_COLUMNS, spill_dir=None, max_cycles_in_memory=None):
+		self.columns = list(columns)
+		self._col = {name: i for i, name in enumerate(self.columns)}
+		self.spill_dir = spill_dir
+		# Sans disque : au-delà de cette limite, seules les données des cycles récents sont gardées
+		self.max_cycles_in_memory = max_cycles_in_memory
+		self.summaries = {}  # id_cycle -> {"max_temperature", "min_voltage", "final_capacity", "n_samples"}
+		self._data = {}  # id_cycle -> matrice (lignes x colonnes), en mémoire
+		self._sizes = {}
+		self._spilled = set()
+		self.current_cycle = None
+		self.version = 0  # Incrémenté à chaque échantillon : clé de cache des vues dérivées (tendance)
+		if spill_dir:
+			os.makedirs(spill_dir, exist_ok=True)
+	
+	def __contains__(self, id_cycle):
+		return id_cycle in self.summaries
+	
+	def cycles(self):
+		return sorted(self.summaries)
+	
+	def append(self, id_cycle, row):
+		if id_cycle != self.current_cycle:
+			self._seal(self.current_cycle)
+			self.current_cycle = id_cycle
+			# Un cycle déjà terminé qui recommence (rejeu en boucle) repart de zéro : données et résumé,
+			# réinséré en dernier pour que l'éviction suive l'ordre d'arrivée
+			self.summaries.pop(id_cycle, None)
+			self._spilled.discard(id_cycle)
+			self._data.pop(id_cycle, None)
+			self._data[id_cycle] = np.empty((INITIAL_CYCLE_ROWS, len(self.columns)), dtype=np.float64)
+			self._sizes[id_cycle] = 0
+		
+		data, size = self._data[id_cycle], self._sizes[id_cycle]
+		if size == len(data):
+			# Doublement de la capacité : coût amorti constant par échantillon
+			data = self._data[id_cycle] = np.concatenate((data, np.empty_like(data)))
+		data[size] = row
+		self._sizes[id_cycle] = size + 1
+		self.version += 1
+		
+		# Résumé tenu à jour à chaque échantillon : aucun re-parcours à l'affichage
+		temperature, voltage = row[self._col["temperature"]], row[self._col["voltage"]]
+		summary = self.summaries.get(id_cycle)
+		if summary is None:
+			self.summaries[id_cycle] = {"max_temperature": temperature, "min_voltage": voltage,
+										"final_capacity": row[self._col["capacity"]], "n_samples": 1}
+		else:
+			summary["max_temperature"] = max(summary["max_temperature"], temperature)
+			summary["min_voltage"] = min(summary["min_voltage"], voltage)
+			summary["final_capacity"] = row[self._col["capacity"]]
+			summary["n_samples"] += 1
+	
+	def _seal(self, id_cycle):
+		# Cycle terminé : tableau ajusté à sa taille, puis écrit sur disque ou évincé si demandé
+		if id_cycle is None or id_cycle not in self._data:
+			return
+		data = self._data[id_cycle][:self._sizes[id_cycle]].copy()
+		if self.spill_dir:
+			np.save(self._spill_path(id_cycle), data)
+			self._spilled.add(id_cycle)
+			del self._data[id_cycle]
+		else:
+			self._data[id_cycle] = data
+			if self.max_cycles_in_memory is not None:
+				while len(self._data) > self.max_cycles_in_memory:
+					oldest = next(c for c in self._data if c != self.current_cycle)
+					del self._data[oldest], self._sizes[oldest]
+	
+	def _spill_path(self, id_cycle):
+		return os.path.join(self.spill_dir, f"cycle_{id_cycle}.npy")
+	
+	def cycle(self, id_cycle):
+		# Colonnes d'un cycle (projetées en mémoire s'il a été écrit sur disque), None si évincé
+		if id_cycle in self._data:
+			data = self._data[id_cycle][:self._sizes[id_cycle]]
+		elif id_cycle in self._spilled:
+			data = np.load(self._spill_path(id_cycle), mmap_mode="r")
+		else:
+			return None
+		return {name: data[:, i] for name, i in self._col.items()}
+	
+	def summary(self, id_cycle):
+		return self.summaries[id_cycle]
+	
+	def trend(self, key="final_capacity"):
+		cycle_ids = self.cycles()
+		return cycle_ids, [self.summaries[c][key] for c in cycle_ids]
+
+
+class HistoryStore:
+	def __init__(self, window=LIVE_WINDOW, columns=HISTORY_COLUMNS, spill_dir=None, max_cycles_in_memory=None):
+		self.columns = list(columns)
+		self.live = RingBuffer(window, self.columns)
+		self.archive = CycleArchive(self.columns, spill_dir, max_cycles_in_memory)
+		self.id_cycle = None
+	
+	def append(self, sample):
+		# La fenêtre temps réel repart de zéro à chaque nouveau cycle (comportement historique)
+		row = [sample[c] for c in self.columns]
+		if sample["id_cycle"] != self.id_cycle:
+			self.live.clear()
+			self.id_cycle = sample["id_cycle"]
+		self.live.append(row)
+		self.archive.append(self.id_cycle, row)
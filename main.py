@@ -1,10 +1,14 @@
+import os
 import time
-import requests
+from collections import OrderedDict
 import plotly.graph_objects as go
 import streamlit as st
 from plotly.subplots import make_subplots
 
-from api import read_aas_value, put_aas_value
+from api import AASClient, AASWriteBack
+from downsample import POINT_BUDGET, lttb
+from history_store import HistoryStore
+from telemetry_feed import TelemetryFeed, UdpChangeListener
 from prediction_module import *
 
 # =========================
@@ -30,29 +34,87 @@ st.markdown("""
 # Constantes
 # =========================
 LOCAL_HOST = "127.0.0.1"
-API_REST_URL = "http://" + LOCAL_HOST + ":8000/predict"
 AAS_URL_DEFAULT = "http://" + LOCAL_HOST + ":8081"
 ass_key = open(r"C:\Users\AMA\PycharmProjects\IHM_ASS_Battery\key.txt", 'r').read().strip()
 AAS_PATH = "{}/submodels/" + ass_key + "/submodel-elements/{}"
-server_thread = APIThread(host=LOCAL_HOST, port=8000)
-server_thread.start()
+HISTORY_SPILL_DIR = None  # Ex. "history_spill" : cycles terminés écrits sur disque
+# Ex. RUL_TELEMETRY_PUSH_PORT=8765 avec "simu.py --notify-port 8765" : plus d'interrogation périodique de l'AAS
+TELEMETRY_PUSH_PORT = int(os.environ.get("RUL_TELEMETRY_PUSH_PORT", "0")) or None
+WRITEBACK_INTERVAL_S = 1.0  # Période des envois groupés vers l'AAS (RUL)
+HISTORY_MAX_CYCLES = 200  # Cycles détaillés gardés en mémoire sans disque (résumés toujours conservés)
+FIGURE_CACHE_SIZE = 64  # Figures Plotly conservées entre deux reruns
+
+
+# =========================
+# Services partagés (une seule instance par processus, malgré les reruns)
+# =========================
+@st.cache_resource
+def start_api_server():
+	# L'API REST reste disponible pour les clients externes, démarrée une seule fois
+	server_thread = APIThread(host=LOCAL_HOST, port=8000)
+	server_thread.start()
+	return server_thread
+
+
+@st.cache_resource
+def get_prediction_service():
+	# Le tableau de bord appelle le prédicteur directement, sans passer par HTTP
+	return PredictionService()
+
+
+@st.cache_resource
+def get_telemetry_feed(port):
+	# Consommateur unique des notifications de changement, partagé par toutes les sessions
+	feed = TelemetryFeed()
+	feed.attach(UdpChangeListener(LOCAL_HOST, port))
+	return feed
+
+
+@st.cache_resource(max_entries=1)
+def load_cycle_model(signature):
+	# Modèle par cycle chargé une fois pour toutes les sessions ; un nouveau fichier (autre signature) le remplace
+	return joblib.load(CYCLE_MODEL_PATH, mmap_mode="r"), joblib.load(CYCLE_FEATURES_PATH)
+
+
+def get_cycle_predictor():
+	# Agrégateur propre à la session, modèle partagé et re-vérifié à chaque rerun (ré-entraînement pris en compte)
+	if not os.path.exists(CYCLE_MODEL_PATH):
+		st.session_state.cycle_predictor = None
+		return None
+	model, features = load_cycle_model(tuple(model_signature(CYCLE_MODEL_PATH).values()))
+	predictor = st.session_state.cycle_predictor
+	if predictor is None:
+		predictor = st.session_state.cycle_predictor = CyclePredictionService(model=model, features=features)
+	else:
+		predictor.model, predictor.features = model, features
+	return predictor
+
+
+start_api_server()
+prediction_service = get_prediction_service()
+telemetry_feed = get_telemetry_feed(TELEMETRY_PUSH_PORT) if TELEMETRY_PUSH_PORT else None
 
 # =========================
 # Initialisation du Session State
 # =========================
+# Fenêtre temps réel (tampon circulaire) + archive colonnaire de tous les cycles pour le Tab 4
 if "history" not in st.session_state:
-	st.session_state.history = {k: [] for k in ["capacity", "voltage", "current", "temperature", "cycle_time", "id_cycle"]}
+	st.session_state.history = HistoryStore(spill_dir=HISTORY_SPILL_DIR, max_cycles_in_memory=HISTORY_MAX_CYCLES)
 
-# Nouveau : Stockage de TOUS les cycles pour le Tab 4
-if "all_cycles_data" not in st.session_state:
-	st.session_state.all_cycles_data = {}
+# Figures déjà construites, indexées par (type, identifiant, version des données)
+if "figure_cache" not in st.session_state:
+	st.session_state.figure_cache = OrderedDict()
 
-if "previous_id_cycle" not in st.session_state:
-	st.session_state.previous_id_cycle = -1
+if "feed_version" not in st.session_state:
+	st.session_state.feed_version = 0
 
 if "estimated_rul" not in st.session_state:
 	st.session_state.estimated_rul = 1000
 
+# Agrégation par cycle : une prédiction par cycle terminé (modèle "model.py --per-cycle")
+if "cycle_predictor" not in st.session_state:
+	st.session_state.cycle_predictor = None
+
 if "sim_estimated_rul" not in st.session_state:
 	st.session_state.sim_estimated_rul = 1000
 
@@ -92,7 +154,10 @@ def draw_battery_icon(percentage, health_ok):
 	st.markdown(html, unsafe_allow_html=True)
 
 
+@st.cache_resource(max_entries=256)
 def create_gauge(value, title, unit, min_val, max_val, color):
+	# Mise en cache par valeur affichée (arrondie à l'appel) : une mesure inchangée réutilise sa figure.
+	# st.cache_resource survit aux reruns (le module est ré-exécuté à chaque fois, un lru_cache serait perdu)
 	fig = go.Figure(go.Indicator(
 		mode="gauge+number",
 		value=value,
@@ -107,42 +172,172 @@ def create_gauge(value, title, unit, min_val, max_val, color):
 	return fig
 
 
+def cached_figure(key, build, single=False):
+	# Une figure n'est reconstruite que si sa clé change (cycle terminé, tendance inchangée = réutilisées)
+	# single : une seule entrée de ce type (key[0]), pour ne pas évincer les autres figures à chaque échantillon
+	cache = st.session_state.figure_cache
+	if key in cache:
+		cache.move_to_end(key)
+		return cache[key]
+	if single:
+		for stale in [k for k in cache if k[0] == key[0]]:
+			del cache[stale]
+	fig = cache[key] = build()
+	while len(cache) > FIGURE_CACHE_SIZE:
+		cache.popitem(last=False)
+	return fig
+
+
+def build_live_figure(live):
+	fig = make_subplots(
+		rows=2, cols=2,
+		subplot_titles=("Voltage (V)", "Current (A)", "Temperature (°C)", "Capacity (%)")
+	)
+	
+	conf = [
+		("voltage", 1, 1, "#1f77b4"),
+		("current", 1, 2, "#ff7f0e"),
+		("temperature", 2, 1, "#d62728"),
+		("capacity", 2, 2, "#2ca02c")
+	]
+	
+	for key, r, c, color in conf:
+		x, y = lttb(live.column("cycle_time"), live.column(key), POINT_BUDGET)
+		fig.add_trace(
+			go.Scatter(
+				x=x,
+				y=y,
+				mode='lines',
+				line=dict(color=color)
+			),
+			row=r, col=c
+		)
+	
+	fig.update_layout(
+		height=500,
+		showlegend=False,
+		margin=dict(l=10, r=10, t=30, b=10)
+	)
+	return fig
+
+
+def build_cycle_figure(hist_data, cycle_id):
+	fig_hist = make_subplots(
+		rows=2, cols=2,
+		subplot_titles=("Voltage over Time", "Current over Time", "Temperature", "Capacity Fade")
+	)
+	
+	h_conf = [
+		("voltage", 1, 1, "#1f77b4", "Voltage (V)"),
+		("current", 1, 2, "#ff7f0e", "Current (A)"),
+		("temperature", 2, 1, "#d62728", "Temp (°C)"),
+		("capacity", 2, 2, "#2ca02c", "Cap (%)")
+	]
+	
+	for key, r, c, color, label in h_conf:
+		# Courbes réduites à POINT_BUDGET points (LTTB) : taille envoyée au navigateur bornée
+		x, y = lttb(hist_data["cycle_time"], hist_data[key], POINT_BUDGET)
+		fig_hist.add_trace(
+			go.Scatter(
+				x=x,
+				y=y,
+				name=label,
+				line=dict(color=color)
+			),
+			row=r, col=c
+		)
+	
+	fig_hist.update_layout(height=600, showlegend=False,
+						   title_text=f"Detailed Analysis: Cycle {cycle_id}")
+	return fig_hist
+
+
+def build_trend_figure(cycle_ids, final_caps):
+	x, y = lttb(cycle_ids, final_caps, POINT_BUDGET)
+	fig_trend = go.Figure()
+	fig_trend.add_trace(go.Scatter(x=x, y=y, mode='lines+markers', name='SOH'))
+	fig_trend.update_layout(height=300, xaxis_title="Cycle Number", yaxis_title="Final Capacity (%)")
+	return fig_trend
+
+
+@st.fragment
+def render_history(archive):
+	# Fragment : changer de cycle ne relance que cette section, pas la lecture ni la prédiction
+	st.subheader("📚 Cycle History Analysis")
+	
+	if archive.cycles():
+		# 1. Sélection du cycle
+		available_cycles = archive.cycles()[::-1]
+		selected_cycle = st.selectbox("Select a cycle to inspect:", available_cycles, key="cycle_selector")
+		
+		# 2. Affichage des métriques résumées du cycle (tenues à jour à l'ajout)
+		summary = archive.summary(selected_cycle)
+		col_h1, col_h2, col_h3 = st.columns(3)
+		col_h1.metric("Max Temp", f"{summary['max_temperature']:.1f} °C")
+		col_h2.metric("Min Voltage", f"{summary['min_voltage']:.2f} V")
+		col_h3.metric("Final Capacity", f"{summary['final_capacity']:.2f} %")
+		
+		# 3. Graphiques du cycle sélectionné (construits une seule fois pour un cycle terminé)
+		hist_data = archive.cycle(selected_cycle)
+		if hist_data is None:
+			st.info("Detailed samples of this cycle are no longer kept in memory.")
+		else:
+			fig_hist = cached_figure(("cycle", selected_cycle, summary["n_samples"]),
+									 lambda: build_cycle_figure(hist_data, selected_cycle))
+			st.plotly_chart(fig_hist, width='stretch')
+		
+		# Optionnel : Affichage de la tendance globale (Capacité vs Cycle ID)
+		st.divider()
+		st.subheader("📈 Global Degradation Trend")
+		cycle_ids, final_caps = archive.trend("final_capacity")
+		# Clé sur la version de l'archive : un cycle rejoué (résumé remis à zéro) invalide aussi la tendance
+		fig_trend = cached_figure(("trend", archive.version),
+								  lambda: build_trend_figure(cycle_ids, final_caps), single=True)
+		st.plotly_chart(fig_trend, width='stretch')
+	
+	else:
+		st.info("No historical data recorded yet.")
+
+
 # =========================
 # Logique de Données
 # =========================
+@st.cache_resource
+def get_aas_client(api_url):
+	# Un client (et son pool de connexions) par URL, conservé entre les reruns Streamlit
+	return AASClient(api_url, ass_key)
+
+
+@st.cache_resource
+def get_aas_writeback(api_url):
+	# Écritures vers l'AAS en arrière-plan : un serveur lent ne bloque plus le rafraîchissement
+	return AASWriteBack(get_aas_client(api_url), flush_interval=WRITEBACK_INTERVAL_S)
+
+
 def fetch_and_update(api_url, max_cap):
 	try:
-		raw_cap = float(read_aas_value(AAS_PATH.format(api_url, "Capacity")))
+		if telemetry_feed is not None:
+			# Mode push : dernier instantané reçu, rien à traiter s'il n'a pas avancé
+			version, telemetry = telemetry_feed.latest()
+			if version == st.session_state.feed_version:
+				return None
+			st.session_state.feed_version = version
+		else:
+			# Une seule lecture du sous-modèle au lieu d'une requête par élément
+			telemetry = get_aas_client(api_url).read_telemetry()
+		raw_cap = telemetry["Capacity"]
 		data = {
 			"raw_cap": raw_cap,
 			"capacity": round((100 * raw_cap) / max_cap, 2) if max_cap > 0 else 0,
-			"voltage": float(read_aas_value(AAS_PATH.format(api_url, "Voltage_measured"))),
-			"current": float(read_aas_value(AAS_PATH.format(api_url, "Current_measured"))),
-			"temperature": float(read_aas_value(AAS_PATH.format(api_url, "Temperature_measured"))),
-			"cycle_time": float(read_aas_value(AAS_PATH.format(api_url, "Time"))),
-			"id_cycle": int(read_aas_value(AAS_PATH.format(api_url, "id_cycle")))
+			"voltage": telemetry["Voltage_measured"],
+			"current": telemetry["Current_measured"],
+			"temperature": telemetry["Temperature_measured"],
+			"cycle_time": telemetry["Time"],
+			"id_cycle": telemetry["id_cycle"]
 		}
 		
-		# --- LOGIQUE DE STOCKAGE HISTORIQUE ---
-		c_id = data["id_cycle"]
-		if c_id not in st.session_state.all_cycles_data:
-			st.session_state.all_cycles_data[c_id] = {k: [] for k in ["capacity", "voltage", "current", "temperature", "cycle_time"]}
-		
-		# On ajoute la donnée au dictionnaire global
-		for key in ["capacity", "voltage", "current", "temperature", "cycle_time"]:
-			st.session_state.all_cycles_data[c_id][key].append(data[key])
-		
-		# --- LOGIQUE TEMPS RÉEL (votre code existant) ---
-		if data["id_cycle"] != st.session_state.previous_id_cycle:
-			for key in st.session_state.history:
-				st.session_state.history[key] = []
-			st.session_state.previous_id_cycle = data["id_cycle"]
-		
-		# Append data
-		for key in ["capacity", "voltage", "current", "temperature", "cycle_time", "id_cycle"]:
-			st.session_state.history[key].append(data[key])
-			if len(st.session_state.history[key]) > 100:
-				st.session_state.history[key].pop(0)
+		# --- STOCKAGE : fenêtre temps réel et archive par cycle (mémoire bornée) ---
+		st.session_state.history.append(data)
 		
 		return data
 	except Exception as e:
@@ -179,20 +374,21 @@ with main:
 				"Time": data["cycle_time"],
 				"id_cycle": data["id_cycle"]
 			}
-			rul_predicted = requests.post(API_REST_URL, json=predict_data).json()["rul_predicted"]
-			st.session_state.estimated_rul = min(st.session_state.estimated_rul, rul_predicted)
-			put_aas_value(AAS_PATH.format(api_url, "RUL"), st.session_state.estimated_rul)
+			cycle_predictor = get_cycle_predictor()
+			if cycle_predictor is not None:
+				rul_predicted = cycle_predictor.observe(predict_data)
+			else:
+				rul_predicted = prediction_service.predict(predict_data)
+			
+			if rul_predicted is not None:
+				st.session_state.estimated_rul = min(st.session_state.estimated_rul, rul_predicted)
+				# Non bloquant ; une RUL inchangée n'est pas réécrite
+				get_aas_writeback(api_url).submit("RUL", st.session_state.estimated_rul)
 		# Affichage (utilise les données du session_state)
-		if st.session_state.history["cycle_time"]:
+		history = st.session_state.history
+		if len(history.live):
 			# Récupérer les dernières valeurs
-			current_data = {
-				"capacity": st.session_state.history["capacity"][-1],
-				"voltage": st.session_state.history["voltage"][-1],
-				"current": st.session_state.history["current"][-1],
-				"temperature": st.session_state.history["temperature"][-1],
-				"cycle_time": st.session_state.history["cycle_time"][-1],
-				"id_cycle": st.session_state.history["id_cycle"][-1]
-			}
+			current_data = {**history.live.last(), "id_cycle": history.id_cycle}
 			
 			# Onglets
 			tab1, tab2, tab3, tab4 = st.tabs(["📋 Données", "📊 Simulation", "📈 Graphics", "📈 Historics"])
@@ -211,21 +407,21 @@ with main:
 				
 				with col_m1:
 					st.plotly_chart(
-						create_gauge(current_data['voltage'], "Voltage", "V", 2, 4.5, "#1f77b4"),
+						create_gauge(round(current_data['voltage'], 2), "Voltage", "V", 2, 4.5, "#1f77b4"),
 						width='stretch',
 						key="gauge_voltage"
 					)
 				
 				with col_m2:
 					st.plotly_chart(
-						create_gauge(current_data['current'], "Current", "A", -5, 0, "#ff7f0e"),
+						create_gauge(round(current_data['current'], 2), "Current", "A", -5, 0, "#ff7f0e"),
 						width='stretch',
 						key="gauge_current"
 					)
 				
 				with col_m3:
 					st.plotly_chart(
-						create_gauge(current_data['temperature'], "Temp.", "°C", 0, 50, "#d62728"),
+						create_gauge(round(current_data['temperature'], 1), "Temp.", "°C", 0, 50, "#d62728"),
 						width='stretch',
 						key="gauge_temperature"
 					)
@@ -243,7 +439,7 @@ with main:
 					st.session_state.sim_current = current_data['current']
 					st.session_state.sim_temperature = current_data['temperature']
 					st.session_state.sim_time = current_data['cycle_time']
-					st.session_state.sim_capacity = data['raw_cap']
+					st.session_state.sim_capacity = data['raw_cap'] if data else st.session_state.sim_capacity
 					st.session_state.sim_cycle_id = current_data['id_cycle']
 				
 				col_n1, col_n2, col_n3, col_n4 = st.columns(4)
@@ -266,102 +462,29 @@ with main:
 					"Time": sim_time,
 					"id_cycle": sim_cycle_id
 				}
-				sim_rul_predicted = requests.post(API_REST_URL, json=sim_predict_data).json()["rul_predicted"]
+				sim_rul_predicted = prediction_service.predict(sim_predict_data)
 				sim_rul = min(st.session_state.sim_estimated_rul, sim_rul_predicted)
 				col_n4.metric("RUL (Cycle)", f"{sim_rul} cycles")
 			
 			with tab3:
 				# --- GRAPHIQUES ---
-				fig = make_subplots(
-					rows=2, cols=2,
-					subplot_titles=("Voltage (V)", "Current (A)", "Temperature (°C)", "Capacity (%)")
-				)
-				
-				conf = [
-					("voltage", 1, 1, "#1f77b4"),
-					("current", 1, 2, "#ff7f0e"),
-					("temperature", 2, 1, "#d62728"),
-					("capacity", 2, 2, "#2ca02c")
-				]
-				
-				for key, r, c, color in conf:
-					fig.add_trace(
-						go.Scatter(
-							x=st.session_state.history["cycle_time"],
-							y=st.session_state.history[key],
-							mode='lines',
-							line=dict(color=color)
-						),
-						row=r, col=c
-					)
-				
-				fig.update_layout(
-					height=500,
-					showlegend=False,
-					margin=dict(l=10, r=10, t=30, b=10)
-				)
+				# Reconstruits seulement quand la fenêtre temps réel a reçu un nouvel échantillon
+				last_sample = history.live.last()
+				fig = cached_figure(
+					("live", history.id_cycle, len(history.live), tuple(last_sample.values()) if last_sample else None),
+					lambda: build_live_figure(history.live), single=True)
 				st.plotly_chart(fig, width='stretch', key="main_plots")
 			
 			with tab4:
-				st.subheader("📚 Cycle History Analysis")
-				
-				if st.session_state.all_cycles_data:
-					# 1. Sélection du cycle
-					available_cycles = sorted(list(st.session_state.all_cycles_data.keys()), reverse=True)
-					selected_cycle = st.selectbox("Select a cycle to inspect:", available_cycles, key="cycle_selector")
-					
-					# 2. Récupération des données du cycle choisi
-					hist_data = st.session_state.all_cycles_data[selected_cycle]
-					
-					# 3. Affichage des métriques résumées du cycle
-					col_h1, col_h2, col_h3 = st.columns(3)
-					col_h1.metric("Max Temp", f"{max(hist_data['temperature']):.1f} °C")
-					col_h2.metric("Min Voltage", f"{min(hist_data['voltage']):.2f} V")
-					col_h3.metric("Final Capacity", f"{hist_data['capacity'][-1]:.2f} %")
-					
-					# 4. Graphiques du cycle sélectionné
-					fig_hist = make_subplots(
-						rows=2, cols=2,
-						subplot_titles=("Voltage over Time", "Current over Time", "Temperature", "Capacity Fade")
-					)
-					
-					h_conf = [
-						("voltage", 1, 1, "#1f77b4", "Voltage (V)"),
-						("current", 1, 2, "#ff7f0e", "Current (A)"),
-						("temperature", 2, 1, "#d62728", "Temp (°C)"),
-						("capacity", 2, 2, "#2ca02c", "Cap (%)")
-					]
-					
-					for key, r, c, color, label in h_conf:
-						fig_hist.add_trace(
-							go.Scatter(
-								x=hist_data["cycle_time"],
-								y=hist_data[key],
-								name=label,
-								line=dict(color=color)
-							),
-							row=r, col=c
-						)
-					
-					fig_hist.update_layout(height=600, showlegend=False,
-										   title_text=f"Detailed Analysis: Cycle {selected_cycle}")
-					st.plotly_chart(fig_hist, width='stretch')
-					
-					# Optionnel : Affichage de la tendance globale (Capacité vs Cycle ID)
-					st.divider()
-					st.subheader("📈 Global Degradation Trend")
-					cycle_ids = sorted(list(st.session_state.all_cycles_data.keys()))
-					final_caps = [st.session_state.all_cycles_data[i]["capacity"][-1] for i in cycle_ids]
-					
-					fig_trend = go.Figure()
-					fig_trend.add_trace(go.Scatter(x=cycle_ids, y=final_caps, mode='lines+markers', name='SOH'))
-					fig_trend.update_layout(height=300, xaxis_title="Cycle Number", yaxis_title="Final Capacity (%)")
-					st.plotly_chart(fig_trend, width='stretch')
-				
-				else:
-					st.info("No historical data recorded yet.")
+				render_history(history.archive)
 		else:
 			st.info("En attente de données...")
 		
-		time.sleep(update_freq)
+		if telemetry_feed is not None:
+			# Rerun seulement quand id_cycle/Time ont avancé : aucun rafraîchissement au repos.
+			# Attente par tranches de update_freq plutôt qu'un blocage unique
+			while telemetry_feed.wait(st.session_state.feed_version, timeout=update_freq)[0] == st.session_state.feed_version:
+				pass
+		else:
+			time.sleep(update_freq)
 		st.rerun()
\ No newline at end of file
@@ -1,12 +1,37 @@
+import argparse
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 
+try:
+	import resource  # Unix uniquement : pic RSS du processus
+except ImportError:
+	resource = None
+
+from cycle_features import CYCLE_FEATURES, CYCLE_FEATURES_PATH, CYCLE_MODEL_PATH, aggregate_cycles
+from dataset_cache import load_columns, load_frame
+import model_store
+
+FEATURES = ['Capacity', 'Voltage_measured', 'Temperature_measured', 'Current_measured', "Time"]
+CHUNK_ROWS = 200_000
+
+# Schéma d'étiquetage de la RUL, enregistré dans les métadonnées : une mise à jour incrémentale
+# étiquette les nouvelles lignes comme le modèle de base, sans quoi la forêt mélangerait deux cibles
+LABEL_GLOBAL = "global_max_cycle"  # Dernier cycle du dataset - id_cycle
+LABEL_PER_BATTERY = "battery_max_cycle"  # Dernier cycle de la batterie - id_cycle
 
-def create_and_train_model():
-	df = pd.read_csv('discharge.csv')
+
+def create_and_train_model(csv_path='discharge.csv', n_jobs=-1):
+	# Cache colonnaire (mmap) : seules les colonnes utiles sont lues, sans reparser le CSV
+	features = FEATURES
+	df = load_frame(features + ['id_cycle', 'Battery'], csv_path)
 	
 	max_cycle = df['id_cycle'].max()
 	df['RUL'] = max_cycle - df['id_cycle']
@@ -15,13 +40,12 @@ def create_and_train_model():
 	print(f"Cycle Max détecté : {max_cycle}")
 	print(df.head())
 	
-	features = ['Capacity', 'Voltage_measured', 'Temperature_measured', 'Current_measured', "Time"]
 	X = df[features]
 	y = df['RUL']
 	
 	X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 	
-	model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42)
+	model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42, n_jobs=n_jobs)
 	model.fit(X_train, y_train)
 	
 	predictions = model.predict(X_test)
@@ -34,9 +58,256 @@ def create_and_train_model():
 	
 	joblib.dump(model, 'rul_model.pkl')
 	joblib.dump(features, 'features_list.pkl')
+	version = model_store.save_version(model, features, full_training_metadata(
+		model, df.groupby('Battery', observed=True)['id_cycle'].max(), LABEL_GLOBAL))
 	
-	print("\nFichier 'rul_model.pkl' généré avec succès.")
+	print(f"\nFichier 'rul_model.pkl' généré avec succès (version {version}).")
+
+
+def full_training_metadata(model, max_cycle_seen, label):
+	# Génération 0 pour tous les arbres ; cycles vus par batterie pour les mises à jour incrémentales
+	return {
+		"kind": "full",
+		"label": label,
+		"generation": 0,
+		"tree_generations": [0] * len(model.estimators_),
+		"max_cycle_seen": {str(b): int(c) for b, c in max_cycle_seen.items()}
+	}
+
+
+# --- Entraînement sur les agrégats par cycle ---
+def create_and_train_cycle_model(csv_path='discharge.csv', n_jobs=-1):
+	# Une ligne par (batterie, cycle) : mêmes agrégats que CycleAggregator côté tableau de bord
+	df = load_frame(FEATURES + ['id_cycle', 'Battery'], csv_path)
+	cycles = aggregate_cycles(df)
+	cycles['RUL'] = cycles.groupby('Battery', observed=True)['id_cycle'].transform('max') - cycles['id_cycle']
+	
+	print(f"--- Agrégats par cycle ---")
+	print(f"{len(df)} échantillons -> {len(cycles)} cycles")
+	print(cycles.head())
+	
+	X = cycles[CYCLE_FEATURES]
+	y = cycles['RUL']
+	
+	X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+	
+	model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=42, n_jobs=n_jobs)
+	model.fit(X_train, y_train)
+	
+	predictions = model.predict(X_test)
+	mae = mean_absolute_error(y_test, predictions)
+	r2 = r2_score(y_test, predictions)
+	
+	print(f"\n--- Performance du Modèle (par cycle) ---")
+	print(f"Erreur Moyenne (MAE) : {mae:.2f} cycles")
+	print(f"Score R² : {r2:.4f} (proche de 1 = excellent)")
+	
+	joblib.dump(model, CYCLE_MODEL_PATH)
+	joblib.dump(CYCLE_FEATURES, CYCLE_FEATURES_PATH)
+	print(f"\nFichier '{CYCLE_MODEL_PATH}' généré avec succès.")
+	return model
+
+
+# --- Entraînement par blocs (hors mémoire) ---
+@contextmanager
+def stage(name, report):
+	# Temps mural et pic mémoire (allocations Python/NumPy suivies par tracemalloc) d'une étape
+	tracemalloc.reset_peak()
+	start = time.perf_counter()
+	yield
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+	report[name] = {"wall_s": round(elapsed, 3), "peak_mb": round(peak, 1)}
+	rss = f" | pic RSS processus {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo" if resource else ""
+	print(f"[{name}] {elapsed:.2f} s | pic mémoire {peak:.1f} Mo{rss}")
+
+
+def iter_chunks(columns, csv_path='discharge.csv', chunk_rows=CHUNK_ROWS):
+	# Tranches successives des colonnes projetées en mémoire : rien n'est chargé d'un bloc
+	arrays = load_columns(columns, csv_path)
+	n_rows = len(arrays[columns[0]])
+	for start in range(0, n_rows, chunk_rows):
+		yield {name: values[start:start + chunk_rows] for name, values in arrays.items()}
+
+
+def battery_max_cycles(csv_path='discharge.csv', chunk_rows=CHUNK_ROWS):
+	# Cycle max par batterie (groupby vectorisé par bloc, puis fusion des maxima)
+	max_cycles = pd.Series(dtype="int64")
+	for chunk in iter_chunks(['id_cycle', 'Battery'], csv_path, chunk_rows):
+		chunk_max = pd.Series(chunk['id_cycle']).groupby(chunk['Battery'].codes).max()
+		max_cycles = chunk_max.combine(max_cycles, max, fill_value=0) if len(max_cycles) else chunk_max
+	return max_cycles
+
+
+def create_and_train_model_streaming(csv_path='discharge.csv', chunk_rows=CHUNK_ROWS, test_size=0.2,
+									 n_jobs=-1, max_samples=None, random_state=42):
+	features = FEATURES
+	report = {}
+	tracemalloc.start()
+	try:
+		with stage("labels", report):
+			max_cycles = battery_max_cycles(csv_path, chunk_rows)
+			max_by_code = np.zeros(max_cycles.index.max() + 1, dtype=np.int64)
+			max_by_code[max_cycles.index.to_numpy()] = max_cycles.to_numpy()
+			n_rows = len(load_columns(['id_cycle'], csv_path)['id_cycle'])
+			print(f"{n_rows} lignes, {len(max_cycles)} batterie(s)")
+		
+		with stage("split", report):
+			# Tirage train/test ligne par ligne, puis remplissage direct de matrices float32 pré-allouées
+			is_test = np.random.default_rng(random_state).random(n_rows) < test_size
+			n_test = int(is_test.sum())
+			X_train = np.empty((n_rows - n_test, len(features)), dtype=np.float32)
+			X_test = np.empty((n_test, len(features)), dtype=np.float32)
+			y_train = np.empty(n_rows - n_test, dtype=np.float64)
+			y_test = np.empty(n_test, dtype=np.float64)
+			
+			start, i_train, i_test = 0, 0, 0
+			for chunk in iter_chunks(features + ['id_cycle', 'Battery'], csv_path, chunk_rows):
+				mask = is_test[start:start + len(chunk['id_cycle'])]
+				X_chunk = np.column_stack([chunk[f] for f in features]).astype(np.float32)
+				y_chunk = max_by_code[chunk['Battery'].codes] - chunk['id_cycle']
+				
+				k_train, k_test = int((~mask).sum()), int(mask.sum())
+				X_train[i_train:i_train + k_train], y_train[i_train:i_train + k_train] = X_chunk[~mask], y_chunk[~mask]
+				X_test[i_test:i_test + k_test], y_test[i_test:i_test + k_test] = X_chunk[mask], y_chunk[mask]
+				start, i_train, i_test = start + len(mask), i_train + k_train, i_test + k_test
+		
+		with stage("fit", report):
+			model = RandomForestRegressor(n_estimators=100, max_depth=10, random_state=random_state,
+										  n_jobs=n_jobs, max_samples=max_samples)
+			model.fit(pd.DataFrame(X_train, columns=features, copy=False), y_train)
+		
+		with stage("evaluate", report):
+			# Métriques accumulées par bloc (prédiction parallèle sur tous les coeurs)
+			abs_error, sq_error, y_sum, y_sq_sum = 0.0, 0.0, 0.0, 0.0
+			for s in range(0, n_test, chunk_rows):
+				y_true = y_test[s:s + chunk_rows]
+				y_pred = model.predict(pd.DataFrame(X_test[s:s + chunk_rows], columns=features, copy=False))
+				abs_error += np.abs(y_true - y_pred).sum()
+				sq_error += ((y_true - y_pred) ** 2).sum()
+				y_sum += y_true.sum()
+				y_sq_sum += (y_true ** 2).sum()
+			mae = abs_error / max(n_test, 1)
+			total_var = y_sq_sum - y_sum ** 2 / max(n_test, 1)
+			r2 = 1 - sq_error / total_var if total_var > 0 else float("nan")
+		
+		with stage("save", report):
+			joblib.dump(model, 'rul_model.pkl')
+			joblib.dump(features, 'features_list.pkl')
+			categories = load_columns(['Battery'], csv_path)['Battery'].categories
+			version = model_store.save_version(model, features, full_training_metadata(
+				model, pd.Series(max_cycles.to_numpy(), index=categories[max_cycles.index]), LABEL_PER_BATTERY))
+	finally:
+		tracemalloc.stop()
+	
+	print(f"\n--- Performance du Modèle ---")
+	print(f"Erreur Moyenne (MAE) : {mae:.2f} cycles")
+	print(f"Score R² : {r2:.4f} (proche de 1 = excellent)")
+	print(f"Temps total : {sum(s['wall_s'] for s in report.values()):.2f} s")
+	
+	print(f"\nFichier 'rul_model.pkl' généré avec succès (version {version}).")
+	return model, report
+
+
+# --- Mise à jour incrémentale de la forêt ---
+def load_base_model(models_dir=model_store.MODELS_DIR):
+	# Dernière version enregistrée, sinon le rul_model.pkl historique (sans métadonnées,
+	# étiqueté comme create_and_train_model d'origine : dernier cycle du dataset)
+	version = model_store.latest_version(models_dir)
+	if version is None:
+		model = joblib.load('rul_model.pkl')
+		return model, {"version": None, "label": LABEL_GLOBAL, "generation": 0,
+					   "tree_generations": [0] * len(model.estimators_)}
+	return joblib.load(model_store.model_path(version, models_dir)), model_store.load_metadata(version, models_dir)
+
+
+def select_new_rows(csv_path, max_cycle_seen, recent_cycles, label=LABEL_PER_BATTERY):
+	# Cycles postérieurs à ceux déjà vus par batterie ; à défaut, les `recent_cycles` derniers cycles
+	arrays = load_columns(FEATURES + ['id_cycle', 'Battery'], csv_path)
+	batteries, id_cycle = arrays['Battery'], np.asarray(arrays['id_cycle'])
+	codes = batteries.codes
+	
+	max_by_code = pd.Series(id_cycle).groupby(codes).max().reindex(range(len(batteries.categories)), fill_value=0).to_numpy()
+	if max_cycle_seen:
+		seen = np.array([max_cycle_seen.get(str(b), -1) for b in batteries.categories], dtype=np.int64)
+	else:
+		seen = max_by_code - recent_cycles
+	
+	mask = id_cycle > seen[codes]
+	X = pd.DataFrame({f: np.asarray(arrays[f])[mask] for f in FEATURES})
+	y = (max_by_code.max() if label == LABEL_GLOBAL else max_by_code[codes[mask]]) - id_cycle[mask]
+	new_seen = {str(b): int(c) for b, c in zip(batteries.categories, max_by_code)}
+	return X, y, new_seen
+
+
+def update_model_incremental(csv_path='discharge.csv', n_new_trees=20, recent_cycles=10, max_trees=None,
+							 max_tree_age=None, n_jobs=-1, models_dir=model_store.MODELS_DIR):
+	model, metadata = load_base_model(models_dir)
+	label = metadata.get("label")
+	if label not in (LABEL_GLOBAL, LABEL_PER_BATTERY):
+		print("Schéma d'étiquetage du modèle de base inconnu : ré-entraînement complet nécessaire avant une mise à jour incrémentale.")
+		return None
+	X_new, y_new, new_seen = select_new_rows(csv_path, metadata.get("max_cycle_seen"), recent_cycles, label)
+	if len(X_new) == 0:
+		print("Aucun nouveau cycle : modèle inchangé.")
+		return None
+	
+	generation = metadata.get("generation", 0) + 1
+	tree_generations = list(metadata.get("tree_generations", [0] * len(model.estimators_)))
+	print(f"--- Mise à jour incrémentale (génération {generation}) ---")
+	print(f"{len(X_new)} nouvelles lignes, {len(model.estimators_)} arbres existants, {n_new_trees} ajoutés")
+	
+	# warm_start : seuls les nouveaux arbres sont ajustés, sur les seules données récentes
+	start = time.perf_counter()
+	model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_new_trees, n_jobs=n_jobs)
+	model.fit(X_new, y_new)
+	model.set_params(warm_start=False)
+	tree_generations += [generation] * n_new_trees
+	print(f"Ajustement : {time.perf_counter() - start:.2f} s")
+	
+	# Politique d'âge : retrait des arbres trop anciens, puis des plus anciens au-delà de max_trees
+	keep = [i for i, g in enumerate(tree_generations) if max_tree_age is None or generation - g <= max_tree_age]
+	if max_trees is not None and len(keep) > max_trees:
+		keep = sorted(sorted(keep, key=lambda i: tree_generations[i])[-max_trees:])
+	if len(keep) < len(tree_generations):
+		print(f"{len(tree_generations) - len(keep)} arbre(s) retiré(s) par la politique d'âge")
+		model.estimators_ = [model.estimators_[i] for i in keep]
+		model.n_estimators = len(model.estimators_)
+		tree_generations = [tree_generations[i] for i in keep]
+	
+	version = model_store.save_version(model, FEATURES, {
+		"kind": "incremental",
+		"label": label,
+		"parent": metadata.get("version"),
+		"generation": generation,
+		"tree_generations": tree_generations,
+		"max_cycle_seen": {**metadata.get("max_cycle_seen", {}), **new_seen},
+		"n_new_rows": int(len(X_new))
+	}, models_dir)
+	print(f"\nVersion {version} enregistrée ({len(model.estimators_)} arbres).")
+	return version
 
 
 if __name__ == "__main__":
-	create_and_train_model()
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="Entraînement du modèle RUL.")
+	parser.add_argument("--streaming", action="store_true", help="Lecture par blocs et RUL calculée par batterie")
+	parser.add_argument("--per-cycle", action="store_true", help="Modèle entraîné sur les agrégats de chaque cycle")
+	parser.add_argument("--csv", default="discharge.csv")
+	parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+	parser.add_argument("--n-jobs", type=int, default=-1, help="Coeurs utilisés (-1 = tous)")
+	parser.add_argument("--max-samples", type=float, default=None, help="Fraction des lignes tirée par arbre")
+	parser.add_argument("--incremental", action="store_true", help="Ajoute des arbres entraînés sur les nouveaux cycles")
+	parser.add_argument("--new-trees", type=int, default=20)
+	parser.add_argument("--recent-cycles", type=int, default=10, help="Fenêtre utilisée si le modèle de base n'a pas de métadonnées")
+	parser.add_argument("--max-trees", type=int, default=None, help="Nombre max d'arbres (les plus anciens sont retirés)")
+	parser.add_argument("--max-tree-age", type=int, default=None, help="Âge max d'un arbre, en générations")
+	args = parser.parse_args()
+	
+	if args.per_cycle:
+		create_and_train_cycle_model(args.csv, n_jobs=args.n_jobs)
+	elif args.incremental:
+		update_model_incremental(args.csv, args.new_trees, args.recent_cycles, args.max_trees, args.max_tree_age, args.n_jobs)
+	elif args.streaming:
+		create_and_train_model_streaming(args.csv, args.chunk_rows, n_jobs=args.n_jobs, max_samples=args.max_samples)
+	else:
+		create_and_train_model(args.csv, n_jobs=args.n_jobs)
@@ -0,0 +1,54 @@
+import json
+import os
+import re
+import time
+
+import joblib
+
+# --- Configuration des artefacts versionnés ---
+# Ancré sur le dossier du code : model.py lancé d'ailleurs écrit là où l'API de prédiction lit
+MODELS_DIR = os.environ.get("RUL_MODELS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+VERSION_PATTERN = re.compile(r"^rul_model_v(\d+)\.pkl$")
+
+
+def model_path(version, models_dir=MODELS_DIR):
+	return os.path.join(models_dir, f"rul_model_v{version:04d}.pkl")
+
+
+def metadata_path(version, models_dir=MODELS_DIR):
+	return os.path.join(models_dir, f"rul_model_v{version:04d}.json")
+
+
+def list_versions(models_dir=MODELS_DIR):
+	if not os.path.isdir(models_dir):
+		return []
+	versions = [int(m.group(1)) for m in map(VERSION_PATTERN.match, os.listdir(models_dir)) if m]
+	return sorted(versions)
+
+
+def latest_version(models_dir=MODELS_DIR):
+	versions = list_versions(models_dir)
+	return versions[-1] if versions else None
+
+
+def load_metadata(version, models_dir=MODELS_DIR):
+	try:
+		with open(metadata_path(version, models_dir), "r") as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+
+def save_version(model, features, metadata=None, models_dir=MODELS_DIR):
+	# Écriture dans des fichiers temporaires puis renommage : une version n'est visible que complète
+	os.makedirs(models_dir, exist_ok=True)
+	version = (latest_version(models_dir) or 0) + 1
+	metadata = dict(metadata or {}, version=version, features=list(features), created_at=time.time())
+	
+	pkl_path, json_path = model_path(version, models_dir), metadata_path(version, models_dir)
+	joblib.dump(model, pkl_path + ".tmp")
+	with open(json_path + ".tmp", "w") as f:
+		json.dump(metadata, f, indent=1)
+	os.replace(json_path + ".tmp", json_path)
+	os.replace(pkl_path + ".tmp", pkl_path)
+	return version
@@ -1,14 +1,64 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import shutil
+import signal
 import threading
+import time
+import warnings
 import uvicorn
 import joblib
+import numpy as np
 import pandas as pd
 import os
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, ValidationError, model_validator
 
-# --- Configuration des chemins ---
-MODEL_PATH = r"C:\Users\AMA\PycharmProjects\IHM_ASS_Battery\rul_model.pkl"
-FEATURES_PATH = r"C:\Users\AMA\PycharmProjects\IHM_ASS_Battery\features_list.pkl"
+import model_store
+from cycle_features import CYCLE_FEATURES_PATH, CYCLE_MODEL_PATH, CycleAggregator
+from forest_compiler import CompiledForest, compile_forest
+from stage_metrics import METRICS_ENABLED, http_request_seconds, profiler, render_prometheus, stage_seconds
+
+# --- Configuration des chemins (surchargés par variables d'environnement) ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get("RUL_MODEL_PATH", os.path.join(BASE_DIR, "rul_model.pkl"))
+FEATURES_PATH = os.environ.get("RUL_FEATURES_PATH", os.path.join(BASE_DIR, "features_list.pkl"))
+MODELS_DIR = model_store.MODELS_DIR  # Déjà ancré sur BASE_DIR (RUL_MODELS_DIR pour le déplacer)
+MODEL_POLL_SECONDS = float(os.environ.get("RUL_MODEL_POLL_S", "10"))  # 0 = pas de rechargement automatique
+
+# --- Configuration du mode batch ---
+MAX_BATCH_SIZE = int(os.environ.get("RUL_MAX_BATCH_SIZE", "1024"))
+
+# --- Chemin rapide optionnel : forêt compilée en tableaux NumPy (voir forest_compiler.py) ---
+USE_COMPILED_FOREST = os.environ.get("RUL_FAST_PATH", "0") == "1"
+
+# --- Regroupement (micro-batching) des requêtes /predict concurrentes ---
+USE_MICROBATCH = os.environ.get("RUL_MICROBATCH", "0") == "1"
+MICROBATCH_MAX_ITEMS = int(os.environ.get("RUL_MICROBATCH_MAX_ITEMS", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("RUL_MICROBATCH_MAX_WAIT_MS", "2"))
+
+# --- Cache des prédictions (0 entrée = désactivé) ---
+CACHE_MAX_ENTRIES = int(os.environ.get("RUL_CACHE_SIZE", "4096"))
+CACHE_TTL_SECONDS = float(os.environ.get("RUL_CACHE_TTL_S", "300"))  # 0 = pas d'expiration
+# Pas de quantification par feature, ex. "Voltage_measured=0.01,Time=1" (vide = clé exacte)
+CACHE_QUANTIZATION = os.environ.get("RUL_CACHE_QUANTIZATION", "")
+
+# --- Bande d'incertitude (quantiles des sorties des arbres) renvoyée sur demande ---
+# Triés : la borne basse est toujours le premier quantile, quel que soit l'ordre de la variable
+UNCERTAINTY_QUANTILES = tuple(sorted(float(q) for q in os.environ.get("RUL_UNCERTAINTY_QUANTILES", "0.05,0.95").split(",")))
+
+# --- Suivi de flotte (0 s = pas de re-calcul périodique) ---
+FLEET_SCORE_INTERVAL_S = float(os.environ.get("RUL_FLEET_INTERVAL_S", "5"))
+FLEET_MAX_AGE_S = float(os.environ.get("RUL_FLEET_MAX_AGE_S", "300"))  # Re-calcul même sans nouvelle donnée
+FLEET_SCORE_BATCH = int(os.environ.get("RUL_FLEET_SCORE_BATCH", "4096"))
+
+# Le modèle est entraîné sur un DataFrame : on l'alimente ici avec une matrice NumPy déjà ordonnée
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
 
 # --- Initialisation de l'application FastAPI ---
 app = FastAPI(
@@ -26,46 +76,706 @@ class BatteryData(BaseModel):
 	Current_measured: float
 	Time: float
 	id_cycle: int
+	
+	@model_validator(mode="wrap")
+	@classmethod
+	def _timed_validation(cls, values, handler):
+		# Durée de la validation pydantic (corps de /predict, éléments de /predict_batch et /fleet/update)
+		with stage_seconds.time("validation"):
+			return handler(values)
 
 
 class PredictionResponse(BaseModel):
 	rul_predicted: int
 	status: str
+	rul_std: Optional[float] = None
+	rul_lower: Optional[int] = None
+	rul_upper: Optional[int] = None
+
+
+# Format "lignes" (samples) ou format colonnes (columns), l'un des deux doit être fourni
+class BatchPredictionRequest(BaseModel):
+	samples: Optional[List[Any]] = None  # Éléments validés un par un : une entrée invalide n'invalide pas le batch
+	columns: Optional[Dict[str, List[Optional[float]]]] = None
+
+
+class BatchItemResult(BaseModel):
+	index: int
+	rul_predicted: Optional[int] = None
+	status: str
+	detail: Optional[str] = None
+	rul_std: Optional[float] = None
+	rul_lower: Optional[int] = None
+	rul_upper: Optional[int] = None
+
+
+class BatchPredictionResponse(BaseModel):
+	results: List[BatchItemResult]
+	n_success: int
+	n_errors: int
+	status: str
+
+
+class FleetUpdateItem(BatteryData):
+	battery_id: str
+
+
+class FleetUpdateRequest(BaseModel):
+	batteries: List[FleetUpdateItem]
+	score: bool = False  # True : re-calcul immédiat au lieu d'attendre le planificateur
+
 
+# --- Registre de modèles versionnés ---
+def model_signature(path):
+	# Identité du fichier modèle : change dès qu'il est réécrit (ré-entraînement sur place)
+	stat = os.stat(path)
+	return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
 
-# --- Chargement des ressources (Modèle et Features) ---
-def load_resources():
+
+def load_compiled_forest(path):
+	# Tableaux de la forêt compilée, écrits une fois à côté du .pkl puis projetés en mémoire :
+	# tous les processus qui chargent cette version partagent les mêmes pages.
+	# source.json garde la signature du .pkl compilé : un .pkl réécrit entraîne une recompilation
+	compiled_dir = os.path.splitext(path)[0] + ".compiled"
+	signature = model_signature(path)
 	try:
-		if not os.path.exists(MODEL_PATH) or not os.path.exists(FEATURES_PATH):
-			return None, None
-		model = joblib.load(MODEL_PATH)
-		features = joblib.load(FEATURES_PATH)
-		return model, features
-	except Exception:
+		with open(os.path.join(compiled_dir, "source.json"), encoding="utf-8") as f:
+			up_to_date = json.load(f) == signature
+	except (OSError, ValueError):
+		up_to_date = False
+	
+	if not up_to_date:
+		tmp_dir = f"{compiled_dir}.tmp{os.getpid()}"
+		compile_forest(joblib.load(path)).save(tmp_dir)
+		with open(os.path.join(tmp_dir, "source.json"), "w", encoding="utf-8") as f:
+			json.dump(signature, f)
+		# L'ancienne version est écartée avant le remplacement (les processus qui la projettent la gardent)
+		stale_dir = f"{compiled_dir}.old{os.getpid()}"
+		if os.path.isdir(compiled_dir):
+			try:
+				os.replace(compiled_dir, stale_dir)
+			except OSError:
+				pass
+		try:
+			os.replace(tmp_dir, compiled_dir)
+		except OSError:
+			shutil.rmtree(tmp_dir, ignore_errors=True)  # Un autre processus l'a écrit avant nous
+		shutil.rmtree(stale_dir, ignore_errors=True)
+	return CompiledForest.load(compiled_dir, mmap_mode="r")
+
+
+class LoadedModel:
+	# Instantané immuable d'une version : une requête en cours garde le sien pendant un remplacement
+	def __init__(self, version, path, features, compiled=None, estimator=None, load_seconds=0.0):
+		self.version = version
+		self.path = path
+		self.features = features
+		self.compiled = compiled
+		self.loaded_at = time.time()
+		self.load_seconds = load_seconds
+		self._estimator = estimator
+		self._forest = compiled
+		self._lock = threading.Lock()
+	
+	@property
+	def estimator(self):
+		# Le modèle sklearn n'est désérialisé qu'au premier besoin (inutile sur le chemin rapide)
+		if self._estimator is None:
+			with self._lock:
+				if self._estimator is None:
+					self._estimator = joblib.load(self.path, mmap_mode="r")
+		return self._estimator
+	
+	@property
+	def forest(self):
+		# Forêt compilée (sorties par arbre en un parcours), construite au premier besoin sur le chemin sklearn
+		if self._forest is None:
+			with self._lock:
+				if self._forest is None:
+					self._forest = load_compiled_forest(self.path)
+		return self._forest
+	
+	@property
+	def engine(self):
+		return self.compiled if self.compiled is not None else self.estimator
+
+
+class ModelRegistry:
+	def __init__(self, models_dir=MODELS_DIR, legacy_model_path=MODEL_PATH, features_path=FEATURES_PATH,
+				 use_compiled=USE_COMPILED_FOREST, poll_seconds=MODEL_POLL_SECONDS):
+		self.models_dir = models_dir
+		self.legacy_model_path = legacy_model_path
+		self.features_path = features_path
+		self.use_compiled = use_compiled
+		self.poll_seconds = poll_seconds
+		self.last_error = None
+		self.pinned_version = None  # Version imposée via /model/reload (sinon : la plus récente)
+		self._active = None
+		self._load_lock = threading.Lock()
+		self._poller = None
+	
+	@property
+	def active(self):
+		return self._active
+	
+	def versions(self):
+		return model_store.list_versions(self.models_dir)
+	
+	def _resolve(self, version=None):
+		# (version, chemin du modèle) : version demandée ou épinglée, sinon la plus récente, sinon rul_model.pkl.
+		# rul_model.pkl est réécrit sur place par model.py : sa version suit la signature du fichier,
+		# ce qui déclenche le rechargement par le poller et invalide le cache
+		version = version if version is not None else self.pinned_version
+		version = version if version is not None else model_store.latest_version(self.models_dir)
+		if version is not None:
+			return version, model_store.model_path(version, self.models_dir)
+		if os.path.exists(self.legacy_model_path):
+			signature = model_signature(self.legacy_model_path)
+			return f"legacy-{signature['mtime_ns']}-{signature['size']}", self.legacy_model_path
 		return None, None
+	
+	def _features_for(self, version):
+		metadata = model_store.load_metadata(version, self.models_dir) if not str(version).startswith("legacy") else {}
+		return metadata.get("features") or joblib.load(self.features_path)
+	
+	def _load(self, version, path):
+		start = time.perf_counter()
+		features = self._features_for(version)
+		if self.use_compiled:
+			loaded = LoadedModel(version, path, features, compiled=load_compiled_forest(path))
+		else:
+			loaded = LoadedModel(version, path, features, estimator=joblib.load(path, mmap_mode="r"))
+		loaded.load_seconds = time.perf_counter() - start
+		return loaded
+	
+	def reload(self, version=None):
+		# Charge hors du chemin des requêtes puis remplace la référence active en une affectation
+		with self._load_lock:
+			version, path = self._resolve(version)
+			if path is None:
+				self.last_error = "Aucun modèle trouvé."
+				return False
+			if self._active is not None and self._active.version == version:
+				self.last_error = None
+				return False
+			try:
+				self._active = self._load(version, path)
+				self.last_error = None
+				print(f">>> Modèle RUL version {version} chargé en {self._active.load_seconds:.2f} s")
+				return True
+			except Exception as e:
+				self.last_error = f"Chargement de la version {version} impossible : {e}"
+				print(self.last_error)
+				return False
+	
+	def get(self):
+		if self._active is None:
+			self.reload()
+			self._start_polling()
+		return self._active
+	
+	def _start_polling(self):
+		if self.poll_seconds <= 0 or self._poller is not None:
+			return
+		
+		def poll():
+			while True:
+				time.sleep(self.poll_seconds)
+				self.reload()
+		
+		self._poller = threading.Thread(target=poll, daemon=True)
+		self._poller.start()
+	
+	def status(self):
+		active = self._active
+		return {
+			"model_version": active.version if active else None,
+			"model_loaded_at": active.loaded_at if active else None,
+			"model_load_seconds": round(active.load_seconds, 4) if active else None,
+			"pinned_version": self.pinned_version,
+			"available_versions": self.versions(),
+			"last_error": self.last_error
+		}
+
+
+registry = ModelRegistry()
+
+
+def active_model():
+	loaded = registry.get()
+	if loaded is None:
+		raise HTTPException(status_code=500, detail="Modèle non disponible.")
+	return loaded
+
+
+# --- Cache LRU/TTL des prédictions ---
+def parse_quantization(spec):
+	steps = {}
+	for item in filter(None, (part.strip() for part in spec.split(","))):
+		name, step = item.split("=")
+		steps[name.strip()] = float(step)
+	return steps
+
+
+class PredictionCache:
+	def __init__(self, max_entries=4096, ttl_seconds=300.0, quantization=None):
+		self.max_entries = max_entries
+		self.ttl_seconds = ttl_seconds
+		self.quantization = quantization or {}
+		self.version = None
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries = OrderedDict()  # clé -> (rul, date d'expiration)
+		self._lock = threading.Lock()
+	
+	def keys(self, X, features_order):
+		# Vecteur de features (quantifié si demandé) -> clé binaire, calculé pour tout le lot
+		if self.quantization:
+			steps = np.array([self.quantization.get(f, 0.0) for f in features_order])
+			X = np.where(steps > 0, np.rint(X / np.where(steps > 0, steps, 1.0)), X)
+		X = np.ascontiguousarray(X, dtype=np.float64) + 0.0  # + 0.0 : -0.0 et 0.0 donnent la même clé
+		return [row.tobytes() for row in X]
+	
+	def _sync_version(self, version):
+		# Toute nouvelle version de modèle invalide l'ensemble du cache
+		if version != self.version:
+			self._entries.clear()
+			self.version = version
+	
+	def lookup(self, version, keys):
+		now = time.monotonic()
+		results = [None] * len(keys)
+		with self._lock:
+			self._sync_version(version)
+			for i, key in enumerate(keys):
+				entry = self._entries.get(key)
+				if entry is not None and (entry[1] is None or entry[1] > now):
+					self._entries.move_to_end(key)
+					results[i] = entry[0]
+					self.hits += 1
+				else:
+					if entry is not None:
+						del self._entries[key]
+					self.misses += 1
+		return results
+	
+	def store(self, version, keys, values):
+		expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+		with self._lock:
+			self._sync_version(version)
+			for key, value in zip(keys, values):
+				self._entries[key] = (int(value), expires_at)
+				self._entries.move_to_end(key)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+	
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+	
+	def metrics(self):
+		total = self.hits + self.misses
+		return {
+			"model_version": self.version,
+			"entries": len(self._entries),
+			"max_entries": self.max_entries,
+			"ttl_seconds": self.ttl_seconds,
+			"quantization": self.quantization,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"hit_ratio": round(self.hits / total, 4) if total else 0.0
+		}
+
+
+prediction_cache = PredictionCache(
+	CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, parse_quantization(CACHE_QUANTIZATION)
+) if CACHE_MAX_ENTRIES > 0 else None
+
+
+# --- Outils de prédiction vectorisée ---
+def build_feature_matrix(records, features_order):
+	# Une seule matrice contiguë (n_lignes x n_features) dans l'ordre de features_order
+	X = np.empty((len(records), len(features_order)), dtype=np.float64)
+	for i, record in enumerate(records):
+		X[i] = [record[f] for f in features_order]
+	return X
+
+
+def _predict_uncached(X, loaded):
+	with stage_seconds.time("model_predict"):
+		predictions = loaded.engine.predict(X)
+	return np.maximum(0, np.rint(predictions)).astype(int)
+
+
+def predict_matrix(X, loaded=None):
+	# Un seul appel au modèle pour toutes les lignes, post-traitement identique à /predict
+	loaded = loaded or active_model()
+	if prediction_cache is None:
+		return _predict_uncached(X, loaded)
+	
+	# Seules les lignes absentes du cache passent dans la forêt
+	with stage_seconds.time("cache_lookup"):
+		keys = prediction_cache.keys(X, loaded.features)
+		cached = prediction_cache.lookup(loaded.version, keys)
+	missing = [i for i, value in enumerate(cached) if value is None]
+	if missing:
+		computed = _predict_uncached(X[missing], loaded)
+		prediction_cache.store(loaded.version, [keys[i] for i in missing], computed)
+		for i, value in zip(missing, computed):
+			cached[i] = value
+	return np.asarray(cached, dtype=int)
+
+
+def predict_matrix_with_uncertainty(X, loaded=None):
+	# Estimation ponctuelle et bande issues du même parcours vectorisé de tous les arbres (sans cache)
+	loaded = loaded or active_model()
+	with stage_seconds.time("model_predict_trees"):
+		mean, std, bounds = loaded.forest.predict_with_spread(X, UNCERTAINTY_QUANTILES)
+	
+	def to_rul(values):
+		return np.maximum(0, np.rint(values)).astype(int)
+	return to_rul(mean), std, to_rul(bounds[:, 0]), to_rul(bounds[:, -1])
+
+
+def _uncertainty_fields(std, lower, upper):
+	return {"rul_std": round(float(std), 3), "rul_lower": int(lower), "rul_upper": int(upper)}
+
+
+def _split_batch(payload, features_order):
+	# Retourne (lignes valides avec leur index, erreurs par index)
+	rows, errors = [], {}
+	
+	if payload.samples is not None:
+		for i, sample in enumerate(payload.samples):
+			if not isinstance(sample, dict):
+				errors[i] = f"Objet JSON attendu, reçu : {type(sample).__name__}"
+				continue
+			try:
+				rows.append((i, BatteryData(**sample).dict()))
+			except ValidationError as e:
+				errors[i] = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+			except TypeError as e:
+				errors[i] = str(e)
+		return rows, errors
+	
+	missing = [f for f in features_order if f not in payload.columns]
+	if missing:
+		raise HTTPException(status_code=400, detail=f"Colonnes manquantes : {missing}")
+	lengths = {len(payload.columns[f]) for f in features_order}
+	if len(lengths) > 1:
+		raise HTTPException(status_code=400, detail="Les colonnes n'ont pas toutes la même longueur.")
+	
+	for i in range(lengths.pop() if lengths else 0):
+		row = {f: payload.columns[f][i] for f in features_order}
+		bad = [f for f, v in row.items() if v is None or not np.isfinite(v)]
+		if bad:
+			errors[i] = f"Valeurs invalides : {bad}"
+		else:
+			rows.append((i, row))
+	return rows, errors
+
+
+# --- Micro-batcher asyncio ---
+class MicroBatcher:
+	def __init__(self, predict_fn, max_items=64, max_wait_ms=2.0, history=1000):
+		self.predict_fn = predict_fn
+		self.max_items = max_items
+		self.max_wait = max_wait_ms / 1000
+		self._queue = None
+		self._task = None
+		
+		# Métriques : compteurs globaux + fenêtre glissante pour les percentiles
+		self.n_batches = 0
+		self.n_items = 0
+		self.n_errors = 0
+		self.batch_sizes = deque(maxlen=history)
+		self.queue_delays = deque(maxlen=history)
+	
+	def _ensure_worker(self):
+		# Le worker est créé dans la boucle asyncio du serveur au premier appel
+		if self._task is None or self._task.done():
+			self._queue = asyncio.Queue()
+			self._task = asyncio.get_running_loop().create_task(self._run())
+	
+	async def submit(self, row):
+		self._ensure_worker()
+		future = asyncio.get_running_loop().create_future()
+		self._queue.put_nowait((row, future, time.perf_counter()))
+		return await future
+	
+	async def _collect(self):
+		# Attend un premier élément puis complète jusqu'à max_items ou max_wait
+		loop = asyncio.get_running_loop()
+		batch = [await self._queue.get()]
+		deadline = loop.time() + self.max_wait
+		while len(batch) < self.max_items:
+			if not self._queue.empty():
+				batch.append(self._queue.get_nowait())
+				continue
+			timeout = deadline - loop.time()
+			if timeout <= 0:
+				break
+			try:
+				batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+			except asyncio.TimeoutError:
+				break
+		return batch
+	
+	async def _run(self):
+		while True:
+			batch = await self._collect()
+			started = time.perf_counter()
+			self.n_batches += 1
+			self.n_items += len(batch)
+			self.batch_sizes.append(len(batch))
+			self.queue_delays.extend(started - enqueued for _, _, enqueued in batch)
+			
+			try:
+				X = np.asarray([row for row, _, _ in batch], dtype=np.float64)
+				results = await asyncio.to_thread(self.predict_fn, X)
+			except Exception as e:
+				self.n_errors += 1
+				for _, future, _ in batch:
+					if not future.done():
+						future.set_exception(e)
+				continue
+			
+			# Chaque appelant récupère sa propre prédiction (sauf s'il a abandonné entre-temps)
+			for (_, future, _), result in zip(batch, results):
+				if not future.done():
+					future.set_result(result)
+	
+	def metrics(self):
+		sizes = np.asarray(self.batch_sizes) if self.batch_sizes else np.zeros(1)
+		delays_ms = np.asarray(self.queue_delays) * 1e3 if self.queue_delays else np.zeros(1)
+		return {
+			"max_items": self.max_items,
+			"max_wait_ms": self.max_wait * 1e3,
+			"n_batches": self.n_batches,
+			"n_items": self.n_items,
+			"n_errors": self.n_errors,
+			"queue_depth": self._queue.qsize() if self._queue is not None else 0,
+			"batch_size_mean": float(sizes.mean()),
+			"batch_size_max": int(sizes.max()),
+			"queue_delay_ms_p50": float(np.percentile(delays_ms, 50)),
+			"queue_delay_ms_p95": float(np.percentile(delays_ms, 95)),
+			"queue_delay_ms_max": float(delays_ms.max())
+		}
+
 
+micro_batcher = MicroBatcher(predict_matrix, MICROBATCH_MAX_ITEMS, MICROBATCH_MAX_WAIT_MS) if USE_MICROBATCH else None
 
-model, features_order = load_resources()
+
+# --- État RUL de la flotte (une ligne compacte par batterie) ---
+FLEET_FIELDS = ['Capacity', 'Voltage_measured', 'Temperature_measured', 'Current_measured', 'Time', 'id_cycle']
+
+
+class FleetState:
+	def __init__(self, model_registry=None, interval_seconds=FLEET_SCORE_INTERVAL_S, max_age_seconds=FLEET_MAX_AGE_S,
+				 score_batch=FLEET_SCORE_BATCH, capacity=1024):
+		self.registry = model_registry or registry
+		self.interval_seconds = interval_seconds
+		self.max_age_seconds = max_age_seconds
+		self.score_batch = score_batch
+		
+		# Tableaux colonnes indexés par ligne ; RUL à -1 tant que la batterie n'a pas été évaluée
+		self.ids = []
+		self.index = {}
+		self.values = np.zeros((capacity, len(FLEET_FIELDS)), dtype=np.float64)
+		self.last_rul = np.full(capacity, -1, dtype=np.int32)
+		self.min_rul = np.full(capacity, -1, dtype=np.int32)
+		self.updated_at = np.zeros(capacity, dtype=np.float64)
+		self.scored_at = np.zeros(capacity, dtype=np.float64)
+		self.dirty = np.zeros(capacity, dtype=bool)
+		self.scored_version = None
+		
+		self.n_runs = 0
+		self.n_scored = 0
+		self.last_run_rows = 0
+		self.last_run_seconds = 0.0
+		self._lock = threading.Lock()
+		self._scheduler = None
+	
+	def _grow(self):
+		# Doublement de la capacité : coût amorti constant par batterie ajoutée
+		capacity = 2 * len(self.values)
+		for name, fill in (("values", 0.0), ("last_rul", -1), ("min_rul", -1), ("updated_at", 0.0),
+						   ("scored_at", 0.0), ("dirty", False)):
+			old = getattr(self, name)
+			new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+			new[:len(old)] = old
+			setattr(self, name, new)
+	
+	def _row(self, battery_id):
+		row = self.index.get(battery_id)
+		if row is None:
+			if len(self.ids) == len(self.values):
+				self._grow()
+			row = self.index[battery_id] = len(self.ids)
+			self.ids.append(battery_id)
+		return row
+	
+	def update_many(self, records):
+		# Dernier enregistrement par batterie, écrit en une affectation vectorisée
+		latest = {record["battery_id"]: record for record in records}
+		X = build_feature_matrix(list(latest.values()), FLEET_FIELDS)
+		with self._lock:
+			rows = np.fromiter((self._row(b) for b in latest), dtype=np.int64, count=len(latest))
+			self.values[rows] = X
+			self.updated_at[rows] = time.time()
+			self.dirty[rows] = True
+		self._start_scheduler()
+		return list(latest)
+	
+	def rescore(self, force=False):
+		# Batteries modifiées, trop anciennes ou évaluées par une autre version du modèle
+		loaded = self.registry.get()
+		if loaded is None:
+			return 0
+		now = time.time()
+		columns = [FLEET_FIELDS.index(f) for f in loaded.features]
+		with self._lock:
+			n = len(self.ids)
+			stale = self.dirty[:n] | (self.scored_at[:n] < now - self.max_age_seconds)
+			if force or loaded.version != self.scored_version:
+				stale[:] = True
+			rows = np.flatnonzero(stale)
+			X = self.values[rows][:, columns]
+			self.dirty[rows] = False  # Une mise à jour pendant le calcul remettra la ligne à évaluer
+		if len(rows) == 0:
+			return 0
+		
+		start = time.perf_counter()
+		try:
+			ruls = np.concatenate([predict_matrix(X[s:s + self.score_batch], loaded)
+								   for s in range(0, len(rows), self.score_batch)])
+		except Exception:
+			with self._lock:
+				self.dirty[rows] = True
+			raise
+		
+		with self._lock:
+			self.last_rul[rows] = ruls
+			previous = self.min_rul[rows]
+			self.min_rul[rows] = np.where(previous < 0, ruls, np.minimum(previous, ruls))
+			self.scored_at[rows] = now
+			self.scored_version = loaded.version
+			self.n_runs += 1
+			self.n_scored += len(rows)
+			self.last_run_rows = len(rows)
+			self.last_run_seconds = time.perf_counter() - start
+		return len(rows)
+	
+	def _start_scheduler(self):
+		if self.interval_seconds <= 0 or self._scheduler is not None:
+			return
+		
+		def run():
+			while True:
+				time.sleep(self.interval_seconds)
+				try:
+					self.rescore()
+				except Exception as e:
+					print(f"Erreur lors du re-calcul de la flotte : {e}")
+		
+		self._scheduler = threading.Thread(target=run, daemon=True)
+		self._scheduler.start()
+	
+	def get(self, battery_id):
+		with self._lock:
+			row = self.index.get(battery_id)
+			if row is None:
+				return None
+			return {
+				"battery_id": battery_id,
+				"features": dict(zip(FLEET_FIELDS, self.values[row].tolist())),
+				"rul_last": int(self.last_rul[row]) if self.last_rul[row] >= 0 else None,
+				"rul_min": int(self.min_rul[row]) if self.min_rul[row] >= 0 else None,
+				"updated_at": float(self.updated_at[row]),
+				"scored_at": float(self.scored_at[row]) or None,
+				"stale": bool(self.dirty[row])
+			}
+	
+	def summary(self):
+		n = len(self.ids)
+		return {
+			"n_batteries": n,
+			"n_stale": int(self.dirty[:n].sum()),
+			"model_version": self.scored_version,
+			"interval_seconds": self.interval_seconds,
+			"max_age_seconds": self.max_age_seconds,
+			"n_runs": self.n_runs,
+			"n_scored": self.n_scored,
+			"last_run_rows": self.last_run_rows,
+			"last_run_seconds": round(self.last_run_seconds, 4)
+		}
+
+
+fleet = FleetState()
 
 
 # --- Endpoints de l'API ---
+if METRICS_ENABLED:
+	@app.middleware("http")
+	async def time_requests(request, call_next):
+		start = time.perf_counter()
+		response = await call_next(request)
+		# Gabarit de la route (ex. /fleet/{battery_id}) pour borner le nombre de séries
+		route = request.scope.get("route")
+		http_request_seconds.observe(getattr(route, "path", "non_routé"), time.perf_counter() - start)
+		return response
+
+
 @app.get("/")
 def health_check():
-	return {"status": "online", "model_loaded": model is not None}
+	loaded = registry.get()
+	return {
+		"status": "online",
+		"model_loaded": loaded is not None,
+		"fast_path": loaded is not None and loaded.compiled is not None,
+		"worker_pid": os.getpid(),
+		**registry.status()
+	}
 
 
-@app.post("/predict", response_model=PredictionResponse)
-def predict(data: BatteryData):
-	if model is None:
-		raise HTTPException(status_code=500, detail="Modèle non disponible.")
+@app.post("/model/reload")
+def reload_model(version: Optional[int] = None):
+	# Sans paramètre : retour à la version la plus récente (et au suivi automatique)
+	previous_pin, registry.pinned_version = registry.pinned_version, version
+	swapped = registry.reload()
+	if registry.last_error:
+		registry.pinned_version = previous_pin
+		raise HTTPException(status_code=404 if version is not None else 500, detail=registry.last_error)
+	return {"swapped": swapped, **registry.status()}
+
+
+def predict_one(data, uncertainty=False):
+	loaded = active_model()
 	
 	try:
+		if uncertainty:
+			X = build_feature_matrix([data.dict()], loaded.features)
+			ruls, std, lower, upper = predict_matrix_with_uncertainty(X, loaded)
+			return {"rul_predicted": int(ruls[0]), "status": "success", **_uncertainty_fields(std[0], lower[0], upper[0])}
+		
+		# Chemin rapide (forêt compilée et/ou cache) : pas de DataFrame
+		if loaded.compiled is not None or prediction_cache is not None:
+			with stage_seconds.time("feature_matrix"):
+				X = build_feature_matrix([data.dict()], loaded.features)
+			return {"rul_predicted": int(predict_matrix(X, loaded)[0]), "status": "success"}
+		
 		# Transformation en DataFrame avec respect de l'ordre des colonnes
-		input_df = pd.DataFrame([data.dict()])
-		X = input_df[features_order]
+		with stage_seconds.time("dataframe"):
+			input_df = pd.DataFrame([data.dict()])
+		with stage_seconds.time("features_reindex"):
+			X = input_df[loaded.features]
 		
 		# Prédiction et post-traitement
-		prediction = model.predict(X)[0]
+		with stage_seconds.time("model_predict"):
+			prediction = loaded.estimator.predict(X)[0]
 		rul_final = max(0, int(round(prediction)))
 		
 		return {"rul_predicted": rul_final, "status": "success"}
@@ -73,6 +783,178 @@ def predict(data: BatteryData):
 		raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/predict", response_model=PredictionResponse, response_model_exclude_none=True)
+async def predict(data: BatteryData, uncertainty: bool = False):
+	# uncertainty=true : quantiles (RUL_UNCERTAINTY_QUANTILES) et écart-type des sorties des arbres
+	if micro_batcher is None or uncertainty:
+		return await run_in_threadpool(predict_one, data, uncertainty)
+	
+	loaded = active_model()
+	try:
+		row = [getattr(data, f) for f in loaded.features]
+		rul_final = await micro_batcher.submit(row)
+		return {"rul_predicted": int(rul_final), "status": "success"}
+	except Exception as e:
+		raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/microbatch/metrics")
+def microbatch_metrics():
+	if micro_batcher is None:
+		return {"enabled": False}
+	return {"enabled": True, **micro_batcher.metrics()}
+
+
+@app.get("/cache/metrics")
+def cache_metrics():
+	if prediction_cache is None:
+		return {"enabled": False}
+	return {"enabled": True, **prediction_cache.metrics()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+	# Histogrammes du processus courant (un par worker en mode multi-processus)
+	return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/profiler/start")
+def profiler_start(interval_ms: float = 5.0):
+	started = profiler.start(interval_ms)
+	return {"started": started, **profiler.status()}
+
+
+@app.post("/profiler/stop")
+def profiler_stop():
+	stopped = profiler.stop()
+	return {"stopped": stopped, **profiler.status()}
+
+
+@app.get("/profiler", response_class=PlainTextResponse)
+def profiler_stacks(limit: Optional[int] = None):
+	return profiler.collapsed(limit)
+
+
+@app.post("/predict_batch", response_model=BatchPredictionResponse, response_model_exclude_none=True)
+def predict_batch(payload: BatchPredictionRequest, uncertainty: bool = False):
+	loaded = active_model()
+	if (payload.samples is None) == (payload.columns is None):
+		raise HTTPException(status_code=400, detail="Fournir soit 'samples', soit 'columns'.")
+	
+	if payload.samples is not None:
+		n_items = len(payload.samples)
+	else:
+		# Seules les colonnes utilisées par le modèle comptent (les autres sont ignorées)
+		n_items = max((len(payload.columns[f]) for f in loaded.features if f in payload.columns), default=0)
+	if n_items > MAX_BATCH_SIZE:
+		raise HTTPException(status_code=413, detail=f"Batch trop grand ({n_items} > {MAX_BATCH_SIZE}).")
+	
+	rows, errors = _split_batch(payload, loaded.features)
+	n_items = len(rows) + len(errors)
+	results = [None] * n_items
+	for i, detail in errors.items():
+		results[i] = {"index": i, "status": "error", "detail": detail}
+	
+	if rows:
+		try:
+			with stage_seconds.time("feature_matrix"):
+				X = build_feature_matrix([row for _, row in rows], loaded.features)
+			if uncertainty:
+				ruls, std, lower, upper = predict_matrix_with_uncertainty(X, loaded)
+				for k, ((i, _), rul) in enumerate(zip(rows, ruls)):
+					results[i] = {"index": i, "rul_predicted": int(rul), "status": "success",
+								  **_uncertainty_fields(std[k], lower[k], upper[k])}
+			else:
+				ruls = predict_matrix(X, loaded)
+				for (i, _), rul in zip(rows, ruls):
+					results[i] = {"index": i, "rul_predicted": int(rul), "status": "success"}
+		except Exception as e:
+			for i, _ in rows:
+				results[i] = {"index": i, "status": "error", "detail": str(e)}
+	
+	n_errors = sum(r["status"] == "error" for r in results)
+	return {
+		"results": results,
+		"n_success": n_items - n_errors,
+		"n_errors": n_errors,
+		"status": "success" if n_errors == 0 else "partial" if n_errors < n_items else "error"
+	}
+
+
+@app.post("/fleet/update")
+def fleet_update(payload: FleetUpdateRequest):
+	updated = fleet.update_many([item.dict() for item in payload.batteries])
+	if not payload.score:
+		return {"n_updated": len(updated), **fleet.summary()}
+	
+	try:
+		fleet.rescore()
+	except Exception as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"n_updated": len(updated), "batteries": [fleet.get(b) for b in updated], **fleet.summary()}
+
+
+@app.post("/fleet/rescore")
+def fleet_rescore():
+	try:
+		n_scored = fleet.rescore(force=True)
+	except Exception as e:
+		raise HTTPException(status_code=400, detail=str(e))
+	return {"n_scored": n_scored, **fleet.summary()}
+
+
+@app.get("/fleet")
+def fleet_summary():
+	return fleet.summary()
+
+
+@app.get("/fleet/{battery_id}")
+def fleet_battery(battery_id: str):
+	state = fleet.get(battery_id)
+	if state is None:
+		raise HTTPException(status_code=404, detail=f"Batterie inconnue : {battery_id}")
+	return state
+
+
+# --- Accès direct (sans HTTP) pour les clients du même processus ---
+class PredictionService:
+	def __init__(self, model_registry=None):
+		self.registry = model_registry or registry
+	
+	def predict_many(self, records):
+		# Même registre, même post-traitement que /predict_batch, sans aller-retour réseau
+		loaded = self.registry.get()
+		if loaded is None:
+			raise RuntimeError("Modèle non disponible.")
+		return predict_matrix(build_feature_matrix(records, loaded.features), loaded)
+	
+	def predict(self, record):
+		return int(self.predict_many([record])[0])
+
+
+class CyclePredictionService:
+	def __init__(self, model_path=CYCLE_MODEL_PATH, features_path=CYCLE_FEATURES_PATH, model=None, features=None):
+		# model/features déjà chargés (partagés entre sessions) : seul l'agrégateur est propre à l'instance
+		self.model = model if model is not None else joblib.load(model_path, mmap_mode="r")
+		self.features = features if features is not None else joblib.load(features_path)
+		self.aggregator = CycleAggregator()
+		self.n_samples = 0
+		self.n_predictions = 0
+	
+	def predict_features(self, cycle_features):
+		X = build_feature_matrix([cycle_features], self.features)
+		return int(max(0, np.rint(self.model.predict(X)[0])))
+	
+	def observe(self, record):
+		# Échantillon agrégé en mémoire constante ; une seule prédiction par cycle terminé
+		self.n_samples += 1
+		completed = self.aggregator.update(record)
+		if completed is None:
+			return None
+		self.n_predictions += 1
+		return self.predict_features(completed[1])
+
+
 # --- Classe Threading pour le serveur Uvicorn ---
 class APIThread(threading.Thread):
 	def __init__(self, host="127.0.0.1", port=8000):
@@ -88,13 +970,109 @@ class APIThread(threading.Thread):
 		self.server.should_exit = True
 
 
+# --- Mode multi-processus : N workers Uvicorn sur un même socket ---
+def _run_worker(host, port, sockets, ready_queue):
+	# Modèle chargé (tableaux projetés en mémoire) avant de signaler que le worker est prêt
+	registry.get()
+	server = uvicorn.Server(config=uvicorn.Config(app=app, host=host, port=port, log_level="error"))
+	ready_queue.put(os.getpid())
+	server.run(sockets=sockets)
+
+
+class APIWorkerPool:
+	def __init__(self, host="127.0.0.1", port=8000, workers=None, ready_timeout=60.0):
+		self.host = host
+		self.port = port
+		self.workers = workers or os.cpu_count() or 1
+		self.ready_timeout = ready_timeout
+		self.processes = []
+		self._context = multiprocessing.get_context("spawn")
+		self._ready_queue = self._context.Queue()
+		self._socket = None
+	
+	def _spawn(self):
+		process = self._context.Process(
+			target=_run_worker,
+			args=(self.host, self.port, [self._socket], self._ready_queue),
+			daemon=True
+		)
+		process.start()
+		return process
+	
+	def start(self):
+		# 1. Forêt compilée écrite une seule fois sur disque : chaque worker la projette en mémoire,
+		#    les pages sont donc partagées au lieu d'un dépickling complet par processus
+		os.environ["RUL_FAST_PATH"] = "1"
+		if ModelRegistry(use_compiled=True, poll_seconds=0).get() is None:
+			print(">>> Aucun modèle disponible : les workers démarrent sans modèle.")
+		
+		# 2. Socket ouvert par le parent et partagé par tous les workers
+		self._socket = uvicorn.Config(app=app, host=self.host, port=self.port).bind_socket()
+		self.processes = [self._spawn() for _ in range(self.workers)]
+		return self.wait_ready()
+	
+	def wait_ready(self):
+		# Prêt quand chaque worker a chargé le modèle et rejoint la boucle de service
+		ready, deadline = set(), time.monotonic() + self.ready_timeout
+		while len(ready) < len(self.processes) and time.monotonic() < deadline:
+			try:
+				ready.add(self._ready_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+			except Exception:
+				break
+		return len(ready) == len(self.processes)
+	
+	def supervise(self):
+		# Relance les workers morts (crash) sans interrompre les autres
+		for i, process in enumerate(self.processes):
+			if not process.is_alive():
+				print(f">>> Worker {process.pid} arrêté (code {process.exitcode}), relance...")
+				self.processes[i] = self._spawn()
+	
+	def stop(self, timeout=30.0):
+		# SIGTERM : chaque worker Uvicorn termine ses requêtes en cours avant de s'arrêter
+		for process in self.processes:
+			if process.is_alive():
+				process.terminate()
+		deadline = time.monotonic() + timeout
+		for process in self.processes:
+			process.join(max(0.0, deadline - time.monotonic()))
+			if process.is_alive():
+				process.kill()
+		if self._socket is not None:
+			self._socket.close()
+
+
+def _interrupt(*_):
+	raise KeyboardInterrupt
+
+
 # --- Programme Principal ---
 if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="API REST de prédiction RUL.")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--workers", type=int, default=0, help="Nombre de processus (0 = thread unique)")
+	args = parser.parse_args()
+	
+	if args.workers > 0:
+		signal.signal(signal.SIGTERM, _interrupt)  # Arrêt propre aussi sur SIGTERM (superviseur, conteneur)
+		pool = APIWorkerPool(host=args.host, port=args.port, workers=args.workers)
+		ready = pool.start()
+		print(f">>> API REST lancée sur http://{args.host}:{args.port} ({args.workers} workers, prêts : {ready})")
+		try:
+			while True:
+				time.sleep(1)
+				pool.supervise()
+		except KeyboardInterrupt:
+			print("\nArrêt des workers...")
+			pool.stop()
+		raise SystemExit(0)
+	
 	# 1. Lancement de l'API dans un thread séparé
-	server_thread = APIThread(host="127.0.0.1", port=8000)
+	server_thread = APIThread(host=args.host, port=args.port)
 	server_thread.start()
 	
-	print(">>> API REST lancée sur http://127.0.0.1:8000")
+	print(f">>> API REST lancée sur http://{args.host}:{args.port}")
 	print(">>> Système de contrôle actif et prêt.")
 	
 	try:
@@ -1,15 +1,21 @@
+import argparse
+import asyncio
+import itertools
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
-from api import put_aas_value
+import numpy as np
+from api import AASClient
+from dataset_cache import load_frame
+from telemetry_feed import UdpChangeNotifier
 
 ass_key = open('key.txt', 'r').read().strip()
 API_URL = "http://localhost:8081"
 AAS_VALUE = "{}/submodels/" + ass_key + "/submodel-elements/{}"
-
-
-df = pd.read_csv("discharge.csv")
-df.sort_values(by=['id_cycle', 'Time'])
+DATASET_PATH = "discharge.csv"
+BATTERY_COLUMN = "Battery"
+ROW_INTERVAL = 1.0  # Secondes entre deux lignes à vitesse x1 (comportement historique)
 
 simu_get_config_value = lambda t: t.split(':')[1]
 
@@ -27,18 +33,176 @@ Temps = simu_get_config_value(simu_config[8])
 Numero_Cycle = simu_get_config_value(simu_config[9])
 Batterie = simu_get_config_value(simu_config[10])
 
+# Colonne du dataset -> nom de la propriété dans l'AAS
+SIMU_COLUMNS = {line.split(':')[0]: simu_get_config_value(line) for line in simu_config if ':' in line}
+
+
+# --- Statistiques de rejeu ---
+class ReplayStats:
+	def __init__(self, history=10_000):
+		self.started = time.perf_counter()
+		self.rows = 0
+		self.errors = 0
+		# Percentiles sur les dernières écritures seulement : mémoire bornée en rejeu infini (--loops 0)
+		self.latencies = deque(maxlen=history)
+	
+	def record(self, latency, ok):
+		self.rows += 1
+		self.errors += not ok
+		self.latencies.append(latency)
+	
+	def report(self):
+		elapsed = time.perf_counter() - self.started
+		latencies_ms = np.asarray(self.latencies) * 1e3 if self.latencies else np.zeros(1)
+		return {
+			"rows": self.rows,
+			"errors": self.errors,
+			"elapsed_s": round(elapsed, 3),
+			"rows_per_s": round(self.rows / elapsed, 2) if elapsed > 0 else 0.0,
+			"write_ms_p50": round(float(np.percentile(latencies_ms, 50)), 3),
+			"write_ms_p95": round(float(np.percentile(latencies_ms, 95)), 3),
+			"write_ms_p99": round(float(np.percentile(latencies_ms, 99)), 3)
+		}
+	
+	def print_report(self, prefix=""):
+		r = self.report()
+		print(f"{prefix}{r['rows']} lignes ({r['errors']} erreurs) en {r['elapsed_s']} s : {r['rows_per_s']} lignes/s | "
+			  f"écriture p50 {r['write_ms_p50']} ms, p95 {r['write_ms_p95']} ms, p99 {r['write_ms_p99']} ms")
+
+
+# --- Moteur de rejeu asynchrone ---
+class ReplayEngine:
+	def __init__(self, api_url=API_URL, columns=None, speed=1.0, concurrency=8, by_battery=False,
+				 submodel_map=None, chunk_size=10_000, queue_size=1_000, notify=None, max_rows=None,
+				 latency_history=10_000):
+		self.api_url = api_url
+		self.columns = columns or SIMU_COLUMNS
+		# speed <= 0 : aussi vite que possible
+		self.interval = ROW_INTERVAL / speed if speed > 0 else 0.0
+		self.concurrency = concurrency
+		self.by_battery = by_battery
+		self.submodel_map = submodel_map or {}
+		self.chunk_size = chunk_size
+		self.queue_size = queue_size
+		# Appelé avec les valeurs écrites (ex. QueueSource.put ou UdpChangeNotifier.send)
+		self.notify = notify
+		self.max_rows = max_rows  # Passe limitée aux premières lignes (mesures reproductibles)
+		
+		self.stats = ReplayStats(latency_history)
+		self._clients = {}
+		self._executor = ThreadPoolExecutor(max_workers=concurrency + 1)
+		self._semaphore = None
+	
+	def client_for(self, battery):
+		# Un sous-modèle par batterie si une correspondance est fournie, sinon celui de key.txt
+		submodel_id = self.submodel_map.get(battery, ass_key)
+		if submodel_id not in self._clients:
+			self._clients[submodel_id] = AASClient(self.api_url, submodel_id, pool_size=self.concurrency)
+		return self._clients[submodel_id]
+	
+	async def _load_groups(self, csv_path):
+		# Colonnes de simu_config.txt projetées depuis le cache colonnaire, puis une partie par batterie
+		loop = asyncio.get_running_loop()
+		frame = await loop.run_in_executor(self._executor, load_frame, list(self.columns), csv_path)
+		if self.max_rows is not None:
+			frame = frame.iloc[:self.max_rows]
+		if not self.by_battery or BATTERY_COLUMN not in frame.columns:
+			return [(None, frame)]
+		return [(battery, group) for battery, group in frame.groupby(BATTERY_COLUMN, observed=True, sort=False)]
+	
+	async def _produce(self, frame, queue):
+		# Un producteur par flux : une file pleine ne retarde que sa propre batterie
+		for start in range(0, len(frame), self.chunk_size):
+			for row in frame.iloc[start:start + self.chunk_size].to_dict("records"):
+				await queue.put({self.columns[col]: value for col, value in row.items()})
+		await queue.put(None)
+	
+	async def _stream(self, battery, queue):
+		# Flux indépendant : lignes écrites dans l'ordre, à son propre rythme
+		loop = asyncio.get_running_loop()
+		client = self.client_for(battery)
+		next_at = loop.time()
+		while True:
+			values = await queue.get()
+			if values is None:
+				break
+			
+			if self.interval:
+				delay = next_at - loop.time()
+				if delay > 0:
+					await asyncio.sleep(delay)
+				next_at = max(next_at + self.interval, loop.time())
+			
+			async with self._semaphore:
+				start = time.perf_counter()
+				try:
+					results = await loop.run_in_executor(self._executor, client.write_values, values)
+					ok = all(results.values())
+				except Exception as e:
+					print(f"Erreur lors de l'écriture ({battery}) : {e}")
+					ok = False
+				self.stats.record(time.perf_counter() - start, ok)
+				if ok and self.notify is not None:
+					self.notify(values)
+	
+	async def replay_once(self, csv_path):
+		tasks = []
+		for battery, frame in await self._load_groups(csv_path):
+			queue = asyncio.Queue(maxsize=self.queue_size)
+			tasks += [self._produce(frame, queue), self._stream(battery, queue)]
+		await asyncio.gather(*tasks)
+	
+	async def _report_periodically(self, every):
+		while True:
+			await asyncio.sleep(every)
+			self.stats.print_report(prefix="[rejeu] ")
+	
+	async def run(self, csv_path=DATASET_PATH, loops=1, report_every=10.0):
+		self._semaphore = asyncio.Semaphore(self.concurrency)
+		reporter = asyncio.create_task(self._report_periodically(report_every)) if report_every else None
+		try:
+			for _ in (itertools.count() if loops <= 0 else range(loops)):
+				await self.replay_once(csv_path)
+		finally:
+			if reporter is not None:
+				reporter.cancel()
+			self._executor.shutdown(wait=False)
+			for client in self._clients.values():
+				client.close()
+		return self.stats.report()
+
+
+def load_submodel_map(path):
+	# Même format que simu_config.txt : une ligne "Batterie:idSousModèle" par batterie
+	if not path:
+		return {}
+	lines = open(path, 'r').read().split("\n")
+	return {line.split(':')[0]: line.split(':', 1)[1].strip() for line in lines if ':' in line}
+
+
 if __name__ == "__main__":
-	while True:
-		for i in range(0,len(df)):
-			put_aas_value(AAS_VALUE.format(API_URL, Voltage_Mesure), df["Voltage_measured"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Current_Mesure), df["Current_measured"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Voltage_Charge), df["Voltage_charge"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Current_Charge), df["Current_charge"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Type), df["type"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Temperature_Ambiante), df["ambient_temperature"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Temperature_Mesure), df["Temperature_measured"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Capacity), df["Capacity"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Temps), df["Time"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Numero_Cycle), df["id_cycle"][i])
-			put_aas_value(AAS_VALUE.format(API_URL, Batterie), df["Battery"][i])
-			time.sleep(1)
\ No newline at end of file
+	parser = argparse.ArgumentParser(description="Rejeu du dataset de décharge vers l'AAS.")
+	parser.add_argument("--csv", default=DATASET_PATH)
+	parser.add_argument("--api-url", default=API_URL)
+	parser.add_argument("--speed", type=float, default=1.0, help="Multiplicateur de vitesse (0 = aussi vite que possible)")
+	parser.add_argument("--concurrency", type=int, default=8, help="Nombre maximal d'écritures simultanées")
+	parser.add_argument("--by-battery", action="store_true", help="Un flux indépendant par valeur de 'Battery'")
+	parser.add_argument("--submodel-map", default=None, help="Fichier 'Batterie:idSousModèle' (un sous-modèle par batterie)")
+	parser.add_argument("--loops", type=int, default=0, help="Nombre de passes sur le dataset (0 = infini)")
+	parser.add_argument("--report-every", type=float, default=10.0)
+	parser.add_argument("--notify-port", type=int, default=None, help="Port UDP local notifié après chaque écriture (tableau de bord en mode push)")
+	args = parser.parse_args()
+	
+	engine = ReplayEngine(
+		api_url=args.api_url,
+		speed=args.speed,
+		concurrency=args.concurrency,
+		by_battery=args.by_battery,
+		submodel_map=load_submodel_map(args.submodel_map),
+		notify=UdpChangeNotifier(port=args.notify_port).send if args.notify_port else None
+	)
+	try:
+		asyncio.run(engine.run(args.csv, loops=args.loops, report_every=args.report_every))
+	except KeyboardInterrupt:
+		pass
+	engine.stats.print_report(prefix="--- Bilan --- ")
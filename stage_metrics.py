@@ -0,0 +1,137 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# --- Configuration ---
+METRICS_ENABLED = os.environ.get("RUL_METRICS", "1") == "1"
+# Bornes des histogrammes (secondes), de 50 µs à 2,5 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# --- Histogrammes en mémoire (format d'exposition Prometheus) ---
+class Histogram:
+	def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+		self.name = name
+		self.help_text = help_text
+		self.label = label
+		self.buckets = tuple(buckets)
+		self._series = {}  # valeur du label -> [compteurs par seau (+Inf inclus), somme, nombre]
+		self._lock = threading.Lock()
+	
+	def observe(self, label_value, seconds):
+		index = bisect.bisect_left(self.buckets, seconds)
+		with self._lock:
+			series = self._series.get(label_value)
+			if series is None:
+				series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+			series[0][index] += 1
+			series[1] += seconds
+			series[2] += 1
+	
+	@contextmanager
+	def time(self, label_value):
+		if not METRICS_ENABLED:
+			yield
+			return
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(label_value, time.perf_counter() - start)
+	
+	def snapshot(self):
+		with self._lock:
+			return {k: ([*counts], total, n) for k, (counts, total, n) in self._series.items()}
+	
+	def render(self):
+		lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+		for value, (counts, total, n) in sorted(self.snapshot().items()):
+			label = f'{self.label}="{value}"'
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float("inf"),), counts):
+				cumulative += count
+				le = "+Inf" if bound == float("inf") else repr(bound)
+				lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+			lines.append(f"{self.name}_sum{{{label}}} {total}")
+			lines.append(f"{self.name}_count{{{label}}} {n}")
+		return "\n".join(lines)
+
+
+stage_seconds = Histogram("rul_stage_seconds", "Durée des étapes du chemin de prédiction.", "stage")
+aas_call_seconds = Histogram("rul_aas_call_seconds", "Durée des appels HTTP vers le serveur AAS.", "call")
+http_request_seconds = Histogram("rul_http_request_seconds", "Durée totale des requêtes HTTP servies.", "path")
+HISTOGRAMS = [stage_seconds, aas_call_seconds, http_request_seconds]
+
+
+def render_prometheus(histograms=None):
+	return "\n".join(h.render() for h in histograms or HISTOGRAMS) + "\n"
+
+
+# --- Profileur par échantillonnage, activable à chaud ---
+class SamplingProfiler:
+	# Relevé périodique des piles de tous les threads (sys._current_frames) : aucun coût hors activation
+	def __init__(self):
+		self.interval = 0.005
+		self.stacks = Counter()
+		self.n_samples = 0
+		self.started_at = None
+		self._stop = threading.Event()
+		self._thread = None
+	
+	@property
+	def running(self):
+		return self._thread is not None and self._thread.is_alive()
+	
+	def start(self, interval_ms=5.0, reset=True):
+		if self.running:
+			return False
+		if reset:
+			self.stacks.clear()
+			self.n_samples = 0
+		self.interval = interval_ms / 1000
+		self.started_at = time.time()
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+		return True
+	
+	def stop(self):
+		if not self.running:
+			return False
+		self._stop.set()
+		self._thread.join()
+		return True
+	
+	def _run(self):
+		own_id = threading.get_ident()
+		while not self._stop.wait(self.interval):
+			for thread_id, frame in sys._current_frames().items():
+				if thread_id == own_id:
+					continue
+				stack = []
+				while frame is not None:
+					code = frame.f_code
+					stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+					frame = frame.f_back
+				self.stacks[";".join(reversed(stack))] += 1
+			self.n_samples += 1
+	
+	def collapsed(self, limit=None):
+		# Format "pile;repliée nombre" (compatible flamegraph.pl / speedscope)
+		return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit)) + "\n"
+	
+	def status(self):
+		return {
+			"running": self.running,
+			"interval_ms": self.interval * 1000,
+			"n_samples": self.n_samples,
+			"n_stacks": len(self.stacks),
+			"started_at": self.started_at
+		}
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,124 @@
+import json
+import queue
+import socket
+import threading
+import time
+
+from api import TELEMETRY_TYPES
+
+# --- Configuration ---
+NOTIFY_HOST = "127.0.0.1"
+NOTIFY_PORT = 8765  # Port UDP des notifications de changement (remplaçant local de l'eventing AAS)
+ADVANCE_KEYS = ("id_cycle", "Time")  # Un nouvel instantané n'est signalé que si ces valeurs changent
+MAX_DATAGRAM = 65507
+
+
+# --- Sources de changements ---
+class QueueSource:
+	# File partagée dans le processus : le moteur de rejeu y dépose les valeurs qu'il vient d'écrire
+	def __init__(self, maxsize=10_000):
+		self.queue = queue.Queue(maxsize=maxsize)
+		self.n_dropped = 0
+	
+	def put(self, changes):
+		# Jamais bloquant pour le producteur : en cas de retard, la plus ancienne notification est perdue
+		while True:
+			try:
+				self.queue.put_nowait(changes)
+				return
+			except queue.Full:
+				try:
+					self.queue.get_nowait()
+					self.n_dropped += 1
+				except queue.Empty:
+					pass
+	
+	def __iter__(self):
+		while True:
+			yield self.queue.get()
+
+
+class UdpChangeListener:
+	# Notifications JSON {idShort: valeur} reçues d'un autre processus (simu.py --notify-port)
+	def __init__(self, host=NOTIFY_HOST, port=NOTIFY_PORT):
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind((host, port))
+	
+	def __iter__(self):
+		while True:
+			datagram, _ = self.sock.recvfrom(MAX_DATAGRAM)
+			try:
+				yield json.loads(datagram)
+			except ValueError:
+				continue
+
+
+class UdpChangeNotifier:
+	def __init__(self, host=NOTIFY_HOST, port=NOTIFY_PORT):
+		self.address = (host, port)
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	
+	def send(self, changes):
+		# Types NumPy (lignes du dataset) convertis en nombres JSON
+		self.sock.sendto(json.dumps(changes, default=float).encode(), self.address)
+
+
+# --- Dernier instantané connu, avec réveil des lecteurs ---
+class TelemetryFeed:
+	def __init__(self, types=None):
+		self.types = types or TELEMETRY_TYPES
+		# Éléments nécessaires avant de publier un premier instantané (la RUL est écrite par le tableau de bord)
+		self.required = [k for k in self.types if k != "RUL"]
+		self.snapshot = {}
+		self.version = 0
+		self.n_messages = 0
+		self.last_update = None
+		self._condition = threading.Condition()
+		self._consumers = []
+	
+	def publish(self, changes):
+		# Fusionne les éléments reçus ; ne réveille les lecteurs que si id_cycle/Time ont avancé
+		values = {k: self.types[k](v) for k, v in changes.items() if k in self.types}
+		with self._condition:
+			self.n_messages += 1
+			before = tuple(self.snapshot.get(k) for k in ADVANCE_KEYS)
+			self.snapshot.update(values)
+			after = tuple(self.snapshot.get(k) for k in ADVANCE_KEYS)
+			if after == before or any(k not in self.snapshot for k in self.required):
+				return False
+			self.version += 1
+			self.last_update = time.time()
+			self._condition.notify_all()
+			return True
+	
+	def latest(self):
+		with self._condition:
+			return self.version, dict(self.snapshot)
+	
+	def wait(self, since_version, timeout=None):
+		# Bloque sans consommer de CPU jusqu'à un instantané plus récent que since_version
+		with self._condition:
+			self._condition.wait_for(lambda: self.version > since_version, timeout)
+			return self.version, dict(self.snapshot)
+	
+	def attach(self, source):
+		# Consommateur en arrière-plan : la source est lue dans son propre thread
+		def consume():
+			for changes in source:
+				try:
+					self.publish(changes)
+				except (TypeError, ValueError) as e:
+					print(f"Notification ignorée : {e}")
+		
+		consumer = threading.Thread(target=consume, daemon=True)
+		consumer.start()
+		self._consumers.append(consumer)
+		return source
+	
+	def status(self):
+		return {
+			"version": self.version,
+			"n_messages": self.n_messages,
+			"last_update": self.last_update,
+			"n_consumers": len(self._consumers)
+		}